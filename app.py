@@ -11,9 +11,12 @@ import uuid
 from flask import Flask, send_from_directory, request, session, jsonify
 from flask_cors import CORS
 from flask_session import Session
-from db import db  # Import db from db.py
+from db import db, init_db, db_health  # Import db from db.py
 from flask_migrate import Migrate
 from cogs import register_cogs  # Import the register_cogs function
+from utils.cache_backend import get_cache_backend, redis_client_from_url, CACHE_URL
+from utils.session_store import SQLiteSessionInterface
+from utils.socketio_queue import create_client_manager, SOCKETIO_MESSAGE_QUEUE
 from dotenv import load_dotenv
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
@@ -72,11 +75,20 @@ app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", os.urandom(24).hex())
 #     raise SystemExit("App failed to start due to Key Vault error")
 
 # Configuration
-app.config['SESSION_TYPE'] = 'filesystem'  # Use filesystem for session storage
+# Session storage: "sqlite" (shared by every worker on this host), "redis" (shared across
+# hosts; SESSION_REDIS_URL, default CACHE_URL) or the legacy "filesystem"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
 app.config['SESSION_PERMANENT'] = True  # Make sessions permanent
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)  # 1 hour
-app.config['SESSION_FILE_DIR'] = os.path.join(app.instance_path, 'sessions')  # Define session file directory
-os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
+if SESSION_BACKEND == "redis":
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client_from_url(os.getenv("SESSION_REDIS_URL", CACHE_URL))
+elif SESSION_BACKEND == "filesystem":
+    app.config['SESSION_TYPE'] = 'filesystem'  # Use filesystem for session storage
+    app.config['SESSION_FILE_DIR'] = os.path.join(app.instance_path, 'sessions')  # Define session file directory
+    os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
+else:
+    app.config['SESSION_SQLITE_PATH'] = os.getenv("SESSION_SQLITE_PATH", os.path.join(app.instance_path, 'sessions.db'))
 
 # Add Timeout and File Upload Configurations
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
@@ -110,15 +122,22 @@ CORS(app, supports_credentials=True, origins=[
 ])
 
 
-Session(app)  # Initialize server-side sessions
-db.init_app(app)  # Initialize the database
+# Initialize server-side sessions
+if SESSION_BACKEND in ("redis", "filesystem"):
+    Session(app)
+else:
+    app.session_interface = SQLiteSessionInterface(
+        app,
+        path=app.config['SESSION_SQLITE_PATH'],
+        permanent=app.config['SESSION_PERMANENT']
+    )
+init_db(app)  # Initialize the database with the pool/engine settings from db.py
 
 @app.before_request
-def ping_db():
-    try:
-        db.session.execute("SELECT 1")
-    except:
-        db.session.rollback()
+def start_background_threads():
+    # No I/O here: just makes sure this worker's DB probe and cache invalidation listener are running
+    db_health.ensure_started(app)
+    get_cache_backend().ensure_listening()
 
 
 # Initialize Flask-Migrate
@@ -131,6 +150,16 @@ migrate = Migrate(app, db)
 #     "https://mc-chat-app.eastus.azurecontainer.io",  # Production origin
 # ]
 
+# Emits go through SOCKETIO_MESSAGE_QUEUE when set, so any worker can reach any room
+socketio_options = {}
+client_manager = create_client_manager(SOCKETIO_MESSAGE_QUEUE)
+if client_manager is not None:
+    socketio_options['client_manager'] = client_manager
+    print(f"SocketIO message queue: {SOCKETIO_MESSAGE_QUEUE.split('@')[-1]}", flush=True)
+elif int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    print("WARNING: WEB_CONCURRENCY > 1 without SOCKETIO_MESSAGE_QUEUE; "
+          "emits will only reach clients on the emitting worker.", flush=True)
+
 # Initialize Flask-SocketIO with the allowed origins
 socketio = SocketIO(
     app,
@@ -138,7 +167,8 @@ socketio = SocketIO(
         "https://mc-chat-app.eastus.azurecontainer.io"
     ],
     transports=["websocket", "polling"],
-    async_mode='eventlet'
+    async_mode='eventlet',
+    **socketio_options
 )
 
 
@@ -153,6 +183,8 @@ print("ChatCog registered.", flush=True)
 with app.app_context():
     db.create_all()
     print("Database tables created.", flush=True)
+    # Don't hand connections opened here to workers forked by gunicorn --preload
+    db.engine.dispose()
 
 
 @app.after_request
@@ -0,0 +1,172 @@
+# benchmarks/history_index.py
+"""
+Compare history-fetch latency (and insert cost) for the message table with the
+old single-column indexes vs. the composite (conversation_id, timestamp, id) index.
+
+Seeds a throwaway SQLite database with the app's schema, then runs the same
+query ChatCog.get_message_page issues (newest N messages of one conversation,
+optionally before a cursor) under both index layouts.
+
+    python benchmarks/history_index.py --messages 1000000 --conversations 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import db  # noqa: E402
+import models  # noqa: E402,F401
+
+OLD_INDEXES = [
+    "CREATE INDEX ix_message_role ON message (role)",
+]
+NEW_INDEXES = [
+    "CREATE INDEX ix_message_conversation_id_timestamp_id ON message (conversation_id, timestamp, id)",
+]
+DROP_OLD = ["DROP INDEX IF EXISTS ix_message_role"]
+DROP_NEW = ["DROP INDEX IF EXISTS ix_message_conversation_id_timestamp_id"]
+
+TAIL_QUERY = text(
+    "SELECT id, role, content, timestamp, token_count FROM message "
+    "WHERE conversation_id = :cid "
+    "ORDER BY timestamp DESC, id DESC LIMIT :limit"
+)
+PAGE_QUERY = text(
+    "SELECT id, role, content, timestamp, token_count FROM message "
+    "WHERE conversation_id = :cid AND (timestamp, id) < "
+    "((SELECT timestamp FROM message WHERE id = :before AND conversation_id = :cid), :before) "
+    "ORDER BY timestamp DESC, id DESC LIMIT :limit"
+)
+
+
+def seed(engine, n_messages, n_conversations, batch=50000):
+    db.metadata.create_all(engine, tables=[models.Conversation.__table__, models.Message.__table__])
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(
+            models.Conversation.__table__.insert(),
+            [{"session_id": f"bench-{i}", "title": "bench", "timestamp": start} for i in range(n_conversations)]
+        )
+    # Drop every message index while bulk loading; each layout is built before it is measured
+    with engine.begin() as conn:
+        for name in ("ix_message_conversation_id", "ix_message_timestamp",
+                     "ix_message_role", "ix_message_conversation_id_timestamp_id"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    rng = random.Random(42)
+    content = "lorem ipsum " * 20
+    seeded = 0
+    t0 = time.perf_counter()
+    while seeded < n_messages:
+        rows = []
+        for i in range(seeded, min(seeded + batch, n_messages)):
+            rows.append({
+                # Interleave conversations the way concurrent chats do
+                "conversation_id": rng.randint(1, n_conversations),
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": content,
+                "timestamp": start + timedelta(seconds=i),
+                "token_count": 50,
+            })
+        with engine.begin() as conn:
+            conn.execute(models.Message.__table__.insert(), rows)
+        seeded += len(rows)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_message_conversation_id ON message (conversation_id)"))
+        conn.execute(text("CREATE INDEX ix_message_timestamp ON message (timestamp)"))
+    print(f"Seeded {n_messages} messages across {n_conversations} conversations in {time.perf_counter() - t0:.1f}s", flush=True)
+
+
+def apply_layout(engine, drop, create):
+    with engine.begin() as conn:
+        for stmt in drop + create:
+            conn.execute(text(stmt))
+        conn.execute(text("ANALYZE"))
+
+
+def time_queries(engine, n_conversations, repeat, limit):
+    rng = random.Random(7)
+    tail, page = [], []
+    with engine.connect() as conn:
+        for _ in range(repeat):
+            cid = rng.randint(1, n_conversations)
+            t0 = time.perf_counter()
+            rows = conn.execute(TAIL_QUERY, {"cid": cid, "limit": limit}).fetchall()
+            tail.append(time.perf_counter() - t0)
+            if rows:
+                t0 = time.perf_counter()
+                conn.execute(PAGE_QUERY, {"cid": cid, "before": rows[-1].id, "limit": limit}).fetchall()
+                page.append(time.perf_counter() - t0)
+        plan = conn.execute(text("EXPLAIN QUERY PLAN " + TAIL_QUERY.text), {"cid": 1, "limit": limit}).fetchall()
+    return tail, page, [row[-1] for row in plan]
+
+
+def time_inserts(engine, n_conversations, count):
+    rows = [{
+        "conversation_id": (i % n_conversations) + 1,
+        "role": "user",
+        "content": "insert cost probe",
+        "timestamp": datetime(2030, 1, 1) + timedelta(seconds=i),
+        "token_count": 4,
+    } for i in range(count)]
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for row in rows:
+            conn.execute(models.Message.__table__.insert(), row)
+    elapsed = time.perf_counter() - t0
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM message WHERE timestamp >= :t"), {"t": datetime(2030, 1, 1)})
+    return elapsed
+
+
+def report(label, tail, page, plan, insert_seconds, inserts):
+    def ms(values, q):
+        if not values:
+            return float("nan")
+        return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+    print(f"\n== {label} ==", flush=True)
+    print(f"plan: {' | '.join(plan)}")
+    print(f"tail window  p50 {ms(tail, 50):8.3f} ms   p95 {ms(tail, 95):8.3f} ms")
+    print(f"keyset page  p50 {ms(page, 50):8.3f} ms   p95 {ms(page, 95):8.3f} ms")
+    print(f"inserts      {inserts / insert_seconds:8.0f} rows/s (single-row, one transaction)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=500, help="queries per layout")
+    parser.add_argument("--limit", type=int, default=20, help="messages per fetch (MAX_MESSAGES)")
+    parser.add_argument("--inserts", type=int, default=5000, help="rows for the insert-cost probe")
+    parser.add_argument("--db", help="SQLite file to use (default: a temporary file, removed afterwards)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="history-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        seed(engine, args.messages, args.conversations)
+
+        apply_layout(engine, DROP_NEW, OLD_INDEXES)
+        tail, page, plan = time_queries(engine, args.conversations, args.repeat, args.limit)
+        insert_seconds = time_inserts(engine, args.conversations, args.inserts)
+        report("before: conversation_id, role, timestamp", tail, page, plan, insert_seconds, args.inserts)
+
+        apply_layout(engine, DROP_OLD, NEW_INDEXES)
+        tail, page, plan = time_queries(engine, args.conversations, args.repeat, args.limit)
+        insert_seconds = time_inserts(engine, args.conversations, args.inserts)
+        report("after: conversation_id, timestamp, (conversation_id, timestamp, id)", tail, page, plan, insert_seconds, args.inserts)
+    finally:
+        engine.dispose()
+        if not args.db:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
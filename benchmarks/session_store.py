@@ -0,0 +1,122 @@
+# benchmarks/session_store.py
+"""
+Per-request Flask session overhead for each storage backend.
+
+Builds a minimal Flask app per backend, pre-populates it with `--existing`
+sessions (a slice of them already expired, as accumulates in production), then
+times requests that read and update one session, against a no-session baseline.
+
+    python benchmarks/session_store.py --requests 2000 --existing 20000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from flask import Flask, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.cache_backend import redis_client_from_url  # noqa: E402
+from utils.session_store import SQLiteSessionInterface  # noqa: E402
+
+
+def build_app(backend, workdir):
+    app = Flask(f"bench_{backend}")
+    app.config["SECRET_KEY"] = "bench"
+    app.config["SESSION_PERMANENT"] = True
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=1)
+
+    if backend == "filesystem":
+        from flask_session import Session
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = os.path.join(workdir, "fs_sessions")
+        Session(app)
+    elif backend == "sqlite":
+        app.session_interface = SQLiteSessionInterface(
+            app, path=os.path.join(workdir, "sessions.db"), cleanup_interval=0
+        )
+    elif backend == "fakeredis":
+        from flask_session import Session
+        app.config["SESSION_TYPE"] = "redis"
+        app.config["SESSION_REDIS"] = redis_client_from_url("fakeredis://")
+        Session(app)
+
+    @app.route("/touch")
+    def touch():
+        if backend != "none":
+            session["session_id"] = session.get("session_id", "bench")
+            session["count"] = session.get("count", 0) + 1
+        return "ok"
+
+    return app
+
+
+def populate(app, count):
+    # Create sessions through real requests so every backend stores them its own way
+    client = app.test_client()
+    for _ in range(count):
+        client.get("/touch")
+        client.delete_cookie("session")
+
+
+def expire_some(backend, app, workdir, fraction):
+    if backend == "sqlite" and fraction:
+        conn = app.session_interface._connection()
+        conn.execute(
+            "UPDATE sessions SET expiry = 0 WHERE rowid % ? = 0", (int(1 / fraction),)
+        )
+
+
+def run(backend, requests, existing, expired_fraction, workdir):
+    app = build_app(backend, workdir)
+    if backend != "none":
+        populate(app, existing)
+        expire_some(backend, app, workdir, expired_fraction)
+
+    client = app.test_client()
+    client.get("/touch")  # establish this client's session cookie
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get("/touch")
+        timings.append(time.perf_counter() - start)
+
+    cleanup = None
+    if backend == "sqlite":
+        start = time.perf_counter()
+        removed = app.session_interface._delete_expired_sessions()
+        cleanup = (removed, time.perf_counter() - start)
+    return timings, cleanup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--existing", type=int, default=20000, help="sessions stored before timing")
+    parser.add_argument("--expired-fraction", type=float, default=0.25)
+    parser.add_argument("--backends", default="none,filesystem,sqlite,fakeredis")
+    args = parser.parse_args()
+
+    baseline = None
+    for backend in args.backends.split(","):
+        workdir = tempfile.mkdtemp(prefix=f"session-bench-{backend}-")
+        try:
+            timings, cleanup = run(backend, args.requests, args.existing, args.expired_fraction, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        p50 = statistics.median(timings) * 1000
+        p95 = statistics.quantiles(timings, n=100)[94] * 1000
+        if backend == "none":
+            baseline = p50
+        overhead = f"  (+{p50 - baseline:.3f} ms over no session)" if baseline is not None and backend != "none" else ""
+        print(f"{backend:<11} p50 {p50:7.3f} ms   p95 {p95:7.3f} ms{overhead}", flush=True)
+        if cleanup:
+            print(f"{'':<11} background sweep removed {cleanup[0]} expired sessions in {cleanup[1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# benchmarks/socketio_fanout.py
+"""
+Socket.IO connection capacity and cross-worker fan-out vs. number of workers.
+
+For each worker count, starts that many eventlet Socket.IO servers (separate
+processes, each with the app's connect handler and the SOCKETIO_MESSAGE_QUEUE
+client manager), spreads `--clients` websocket clients across them, then emits one
+`status_update` per session room from a separate write-only queue publisher, the way
+an emit from any other worker or container reaches a room. Reports connect latency,
+the fraction of events delivered, delivery latency and delivered events/s.
+
+Uses Redis at `--queue`, or starts a fakeredis TCP server if none is given.
+
+    python benchmarks/socketio_fanout.py --workers 1,2,4 --clients 2000 --rounds 5
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# --- server / queue processes -----------------------------------------------
+def serve(port, queue_url):
+    import eventlet
+    eventlet.monkey_patch()
+    from flask import Flask, request
+    from flask_socketio import SocketIO, emit, join_room
+    from utils.socketio_queue import create_client_manager
+
+    app = Flask("socketio_bench")
+    sio = SocketIO(app, async_mode="eventlet", client_manager=create_client_manager(queue_url))
+
+    @sio.on("connect")
+    def handle_connect():
+        # Same work as ChatCog's connect handler
+        session_id = request.args.get("session_id")
+        join_room(session_id)
+        emit("connected", {"session_id": session_id})
+
+    sio.run(app, host="127.0.0.1", port=port, log_output=False)
+
+
+def serve_fake_redis(port):
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    server.serve_forever()
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+# --- minimal websocket / engine.io client -----------------------------------
+class WSClient:
+    """
+    Just enough RFC 6455 + Engine.IO v4 to hold a Socket.IO connection open and read events.
+    """
+
+    def __init__(self, port, session_id):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=30)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((
+            f"GET /socket.io/?EIO=4&transport=websocket&session_id={session_id} HTTP/1.1\r\n"
+            f"Host: 127.0.0.1:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        self.buffer = b""
+        while b"\r\n\r\n" not in self.buffer:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Handshake closed")
+            self.buffer += chunk
+        head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        if b" 101 " not in head.split(b"\r\n", 1)[0]:
+            raise ConnectionError(head.split(b"\r\n", 1)[0].decode())
+
+    def _read(self, n):
+        while len(self.buffer) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed")
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def send(self, text):
+        payload = text.encode()
+        mask = os.urandom(4)
+        header = bytes([0x81])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        else:
+            header += bytes([0x80 | 126]) + len(payload).to_bytes(2, "big")
+        self.sock.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    def recv(self):
+        first, second = self._read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(self._read(2), "big")
+        elif length == 127:
+            length = int.from_bytes(self._read(8), "big")
+        payload = self._read(length)
+        if first & 0x0F == 0x8:
+            raise ConnectionError("Server closed the connection")
+        return payload.decode()
+
+    def next_event(self):
+        # Answers engine.io pings; returns (event, data) for the next Socket.IO event
+        while True:
+            packet = self.recv()
+            if packet == "2":
+                self.send("3")
+            elif packet.startswith("42"):
+                event, data = json.loads(packet[2:])
+                return event, data
+
+    def connect(self):
+        self.recv()          # engine.io OPEN
+        self.send("40")      # socket.io CONNECT to the default namespace
+        return self.next_event()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# --- benchmark --------------------------------------------------------------
+def run(workers, clients, rounds, queue_url, base_port, concurrency):
+    import eventlet
+    from eventlet.greenpool import GreenPool
+    from utils.socketio_queue import create_client_manager
+
+    procs = []
+    ports = [base_port + i for i in range(workers)]
+    for port in ports:
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--queue", queue_url],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+    try:
+        for port in ports:
+            wait_for_port(port)
+
+        connect_times, conns, failures = [], [], [0]
+
+        def open_client(i):
+            start = time.perf_counter()
+            try:
+                conn = WSClient(ports[i % workers], f"bench-{i}")
+                event, _ = conn.connect()
+                if event != "connected":
+                    raise ConnectionError(f"Unexpected first event {event}")
+            except Exception:
+                failures[0] += 1
+                return
+            connect_times.append(time.perf_counter() - start)
+            conns.append((i, conn))
+
+        pool = GreenPool(concurrency)
+        connect_start = time.perf_counter()
+        for i in range(clients):
+            pool.spawn_n(open_client, i)
+        pool.waitall()
+        connect_elapsed = time.perf_counter() - connect_start
+
+        latencies, delivered = [], [0]
+
+        def read_events(conn):
+            for _ in range(rounds):
+                try:
+                    with eventlet.Timeout(10):
+                        event, data = conn.next_event()
+                except (Exception, eventlet.Timeout):
+                    return
+                if event == "status_update":
+                    latencies.append(time.time() - data["sent"])
+                    delivered[0] += 1
+
+        readers = GreenPool(len(conns) or 1)
+        for _, conn in conns:
+            readers.spawn_n(read_events, conn)
+
+        publisher = create_client_manager(queue_url, write_only=True)
+        emit_start = time.perf_counter()
+        for r in range(rounds):
+            for i, _ in conns:
+                publisher.emit("status_update", {"message": f"round {r}", "sent": time.time()},
+                               room=f"bench-{i}", namespace="/")
+            eventlet.sleep(0)
+        readers.waitall()
+        emit_elapsed = time.perf_counter() - emit_start
+
+        for _, conn in conns:
+            conn.close()
+        return {
+            "connected": len(conns),
+            "failed": failures[0],
+            "connect_rate": len(conns) / connect_elapsed if connect_elapsed else 0,
+            "connect_p50": statistics.median(connect_times) * 1000 if connect_times else 0,
+            "connect_p95": statistics.quantiles(connect_times, n=100)[94] * 1000 if len(connect_times) > 1 else 0,
+            "delivered": delivered[0] / (len(conns) * rounds) if conns else 0,
+            "deliver_p50": statistics.median(latencies) * 1000 if latencies else 0,
+            "deliver_p95": statistics.quantiles(latencies, n=100)[94] * 1000 if len(latencies) > 1 else 0,
+            "throughput": delivered[0] / emit_elapsed if emit_elapsed else 0,
+        }
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5, help="status_update events per client")
+    parser.add_argument("--queue", help="redis:// URL (default: a throwaway fakeredis TCP server)")
+    parser.add_argument("--base-port", type=int, default=5100)
+    parser.add_argument("--concurrency", type=int, default=200, help="clients connecting at once")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fake-redis", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.queue)
+    if args.fake_redis:
+        return serve_fake_redis(args.fake_redis)
+
+    import eventlet
+    eventlet.monkey_patch()
+
+    fake = None
+    queue_url = args.queue
+    if not queue_url:
+        port = args.base_port - 1
+        fake = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--fake-redis", str(port)])
+        wait_for_port(port)
+        queue_url = f"redis://127.0.0.1:{port}/0"
+
+    print(f"{args.clients} clients, {args.rounds} room emits each, queue {queue_url.split('@')[-1]}, "
+          f"{os.cpu_count()} CPU(s)", flush=True)
+    try:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            r = run(workers, args.clients, args.rounds, queue_url, args.base_port, args.concurrency)
+            print(
+                f"workers={workers:<2} connected {r['connected']:>6} (failed {r['failed']})  "
+                f"connect {r['connect_rate']:7.0f}/s p50 {r['connect_p50']:6.1f} ms p95 {r['connect_p95']:7.1f} ms  "
+                f"delivered {r['delivered'] * 100:5.1f}%  p50 {r['deliver_p50']:7.1f} ms p95 {r['deliver_p95']:7.1f} ms  "
+                f"{r['throughput']:7.0f} events/s",
+                flush=True
+            )
+    finally:
+        if fake:
+            fake.terminate()
+            fake.wait()
+
+
+if __name__ == "__main__":
+    main()
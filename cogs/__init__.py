@@ -3,14 +3,22 @@ from .chat import ChatCog
 from .uploads import UploadsCog
 from .conversations import ConversationsCog
 from .orchestration_analysis import OrchestrationAnalysisCog
+from .conversation_summary import ConversationSummaryCog
 from .web_search import WebSearchCog
 from .code_files import CodeFilesCog
+from .jobs import JobsCog
+from .metrics import MetricsCog
 
 
 
 def register_cogs(app, flask_app, socketio):
     chat_cog = ChatCog(app, flask_app, socketio)
     uploads_cog = UploadsCog(chat_cog.upload_folder)
+    metrics_cog = MetricsCog(
+        history_cache=chat_cog.history_cache,
+        cache_backend=chat_cog.cache_backend,
+        status_emitter=chat_cog.status_emitter
+    )
     # conversations_cog = ConversationsCog()
     # orchestration_analysis_cog = OrchestrationAnalysisCog(chat_cog.client)
     # web_search_cog = WebSearchCog(openai_client=chat_cog.client)
@@ -18,7 +26,10 @@ def register_cogs(app, flask_app, socketio):
 
 
     app.register_blueprint(chat_cog.bp)
+    app.register_blueprint(chat_cog.jobs_cog.bp)
+    app.register_blueprint(chat_cog.file_extraction_cog.bp)
     app.register_blueprint(uploads_cog.bp)
+    app.register_blueprint(metrics_cog.bp)
     # app.register_blueprint(conversations_cog.bp)
     print('Cogs loaded', flush=True)
     # Register other cogs as needed
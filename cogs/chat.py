@@ -1,24 +1,33 @@
 # cogs/chat.py
-from flask import Blueprint, request, jsonify, send_from_directory, copy_current_request_context, session
+from flask import Blueprint, request, jsonify, send_from_directory, copy_current_request_context, session, current_app
 import os
+import eventlet
 import gc
-import json
 import uuid
 import openai
-import tiktoken
 from werkzeug.utils import secure_filename
-from db import db
+from db import db, db_health
+from sqlalchemy import tuple_
 import traceback
 from models import Conversation, Message, UploadedFile
-from datetime import datetime
 from flask_socketio import SocketIO, emit, join_room, rooms
-from eventlet.timeout import Timeout
 # from sqlalchemy.orm import joinedload
 
 # Import the updated process_uploaded_file with Azure support
-from utils.file_utils import process_uploaded_file
-from utils.response_generation import generate_image, generate_chat_response
+from utils.file_utils import process_uploaded_file, read_file_content
+from utils.extracted_text import EXTRACTION_ERRORS, sha256_file, get_extracted_text, get_or_extract_text
+from utils.retrieval_index import RetrievalIndex, get_embedder
+from utils.response_generation import generate_image, generate_chat_response, generate_chat_response_stream
+from utils.pipeline import StagedExecutor
+from utils.token_utils import count_message_tokens
+from utils.history_cache import HistoryCache
+from utils.cache_backend import get_cache_backend
+from utils.status_emitter import StatusEmitter
 from cogs.orchestration_analysis import OrchestrationAnalysisCog
+from cogs.conversation_summary import ConversationSummaryCog
+from cogs.conversation_management import ConversationManagement
+from cogs.jobs import JobsCog, JobQueueFull
+from cogs.file_extraction import FileExtractionCog
 from .web_search import WebSearchCog
 from .code_files import CodeFilesCog
 from cogs.code_structure_visualizer import CodeStructureVisualizerCog
@@ -45,6 +54,30 @@ except ImportError:
 
 WORD_LIMIT = 50000
 MAX_MESSAGES = 20  # <--- Limit the number of messages in memory
+MESSAGE_PAGE_SIZE = 50  # Default page size for /conversations/<id>/messages
+MAX_MESSAGE_PAGE_SIZE = 200
+HISTORY_SHARED_TTL = int(os.getenv("HISTORY_SHARED_TTL", "300"))  # seconds in the shared cache
+FILE_TEXT_CACHE_TTL = int(os.getenv("FILE_TEXT_CACHE_TTL", "86400"))
+# Requested files totalling more words than this are sent as retrieved excerpts, not in full
+RETRIEVAL_FULL_TEXT_WORDS = int(os.getenv("RETRIEVAL_FULL_TEXT_WORDS", "3000"))
+# Stream replies as `token_delta` events unless the client opts out per request
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes", "on")
+# Hand long-running actions to the job pool and answer /chat with a job ID (clients can opt in/out per request)
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "false").lower() in ("1", "true", "yes", "on")
+
+DEFAULT_SYSTEM_PROMPT = "You are a USMC AI agent. Provide relevant responses."
+
+# Concurrent stages of run_chat: shared green pool size and per-stage timeouts (seconds)
+PIPELINE_POOL_SIZE = int(os.getenv("PIPELINE_POOL_SIZE", "200"))
+STAGE_TIMEOUTS = {
+    "history": 15,
+    "summary": 15,
+    "session_files": 15,
+    "search_terms": 20,
+}
+# Generate search terms alongside the gpt-4o orchestration call (rules and cache both missed). Off by
+# default: it's a paid gpt-4o-mini call on every such turn, wasted whenever web search isn't picked.
+SPECULATIVE_SEARCH_TERMS = os.getenv("SPECULATIVE_SEARCH_TERMS", "false").lower() in ("1", "true", "yes", "on")
 
 
 
@@ -52,6 +85,7 @@ class ChatCog:
     def __init__(self, app_instance, flask_app, socketio):  # <-- Modified to accept socketio
         self.bp = Blueprint("chat_blueprint", __name__)
         self.socketio = socketio  # <-- Store socketio instance
+        self.flask_app = flask_app
 
         # Initialize OpenAI client
         openai_key = os.getenv("OPENAI_KEY")
@@ -62,11 +96,29 @@ class ChatCog:
         # Initialize other cogs
         self.web_search_cog = WebSearchCog(openai_client=self.client)
         self.code_files_cog = CodeFilesCog()
-        self.orchestration_analysis_cog = OrchestrationAnalysisCog(self.client)
+        # Shared (cross-worker) cache layer behind the per-process caches
+        self.cache_backend = get_cache_backend()
+        self.orchestration_analysis_cog = OrchestrationAnalysisCog(self.client, cache_backend=self.cache_backend)
+        self.conversation_summary_cog = ConversationSummaryCog(self.client, flask_app, recent_window=MAX_MESSAGES)
 
         self.google_key = google_key
         self.app_instance = app_instance
 
+        # Green threads for the independent stages of each /chat request
+        self.stage_pool = eventlet.GreenPool(PIPELINE_POOL_SIZE)
+
+        # Progress events (statuses, token deltas, job updates) are coalesced and rate-limited per room
+        self.status_emitter = StatusEmitter(socketio)
+
+        # Worker pool for long-running actions (CRM review, images, web search, visualization)
+        self.jobs_cog = JobsCog(flask_app, socketio, status_emitter=self.status_emitter)
+
+        # Newest messages per conversation, filled on first read and written through on save
+        self.history_cache = HistoryCache(window=max(MESSAGE_PAGE_SIZE, MAX_MESSAGES))
+        self.cache_backend.subscribe(
+            "history", lambda message: self.history_cache.invalidate(message["conversation_id"])
+        )
+
         # self.lang_graph = LangGraph()
         # # Define your tasks
         # self.lang_graph.add_node("handle_user_input")
@@ -113,6 +165,19 @@ class ChatCog:
 
         self.azure_container_name = os.getenv("AZURE_CONTAINER_NAME", "my-container-name")
 
+        # Chunk vectors of extracted file text, for sending only the relevant passages of large files
+        self.retrieval_index = RetrievalIndex(
+            get_embedder(self.client), index_dir=os.path.join(flask_app.instance_path, 'retrieval_index')
+        )
+
+        # Uploads are answered once stored; their text is extracted (and indexed) in the background
+        self.file_extraction_cog = FileExtractionCog(
+            flask_app, self.upload_folder, status_emitter=self.status_emitter,
+            retrieval_index=self.retrieval_index,
+            blob_service_client=self.blob_service_client if self.use_azure else None,
+            container_name=self.azure_container_name
+        )
+
         print(f'Adding routes...', flush=True)
         self.add_routes()
         print("Routes added.", flush=True)
@@ -154,210 +219,348 @@ class ChatCog:
             session_id = request.args.get('session_id')
             print(f'Client disconnected: {session_id}', flush=True)
 
-        @self.socketio.on('orchestrate')
-        def handle_orchestration(data):
-            session_id = data.get('room')  # Explicitly get session_id from payload
-            action = data.get('action')
-            if session_id and action:
-                print(f'Orchestration event received: {action}', flush=True)
-                # Example: Emit a status update for the received action
-                status_message = f'Processing action: {action}'
-                self.socketio.emit('status_update', {'message': status_message}, room=session_id)
-                # Further handling based on action...
-            else:
-                print('Orchestration event missing session_id or action.', flush=True)
+        @self.socketio.on('chat')
+        def handle_chat(data):
+            # Same pipeline as POST /chat, for clients already on the socket (file uploads stay
+            # on HTTP). Acks at once; status, tokens and the result follow as room events.
+            try:
+                data = dict(data or {})
+                data.setdefault("room", request.args.get('session_id'))
+                params = self.get_chat_params(data)
+            except Exception as e:
+                return {"status": "error", "error": str(e)}
+            if params["session_id"] not in rooms():
+                return {"status": "error", "error": "Not joined to this session's room"}
+            if not params["message"]:
+                return {"status": "error", "error": "No message provided"}
+
+            request_id = data.get("request_id") or str(uuid.uuid4())
+            self.socketio.start_background_task(self._run_socket_chat, request_id, params)
+            return {"status": "accepted", "request_id": request_id, "session_id": params["session_id"]}
 
     def _chat_logic(self):
         print(flush=True)
         try:
-            # Check the Content-Type of the request
-            if request.content_type.startswith('multipart/form-data'):
-                # Handle file uploads (multiple files)
-                message = request.form.get("message", "")
-                model = request.form.get("model", "gpt-4o-mini")
-                temperature = float(request.form.get("temperature", 0.7))
-                files = request.files.getlist("files")
-
-                if not files and not message:
-                    raise ValueError("No message or file provided")
-
-                session_id = request.form.get("room")
-                if not session_id:
-                    session_id = str(uuid.uuid4())  # Generate a new session ID if missing
-                    print(f"Generated new session_id for /chat: {session_id}", flush=True)
-
-                print(f"Handling multipart/form-data request with session_id: {session_id}", flush=True)
-
-            elif request.is_json:
-                # Handle JSON requests
-                data = request.get_json()
-                if not data:
-                    raise ValueError("Invalid JSON payload")
-
-                session_id = data.get("room")
-                message = data.get("message", "")
-                model = data.get("model", "gpt-4o-mini")
-                temperature = float(data.get("temperature", 0.7))
-                files = None  # No file in JSON requests
+            data, files = self.get_request_data()
+            params = self.get_chat_params(data, files)
+            print(f"Handling {request.mimetype} request with session_id: {params['session_id']}", flush=True)
+            payload, status = self.run_chat(params)
+            return jsonify(payload), status
 
-                if not session_id:
-                    session_id = str(uuid.uuid4())  # Generate a new session ID if missing
-                    print(f"Generated new session_id for /chat: {session_id}", flush=True)
-
-                print(f"Handling application/json request with session_id: {session_id}", flush=True)
+        except Exception as e:
+            print(f"Error in /chat route: {e}", flush=True)
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
 
-            else:
-                raise ValueError("Unsupported Content-Type")
+    def run_chat(self, params):
+        """
+        Run one chat turn from `get_chat_params` output and return (payload, status_code).
+        Shared by POST /chat and the `chat` socket event; needs an app context, not a request.
+        """
+        session_id = params["session_id"]
+        message = params["message"]
+        model = params["model"]
+        temperature = params["temperature"]
+        system_prompt = params["system_prompt"]
+        files = params["files"]
+        stream = params["stream"]
+        background = params["background"]
+        print(f"User Message: {message}", flush=True)
+
+        print(f"files: {files}")
+
+        # Manage conversation
+        print('Getting conversation ID.', flush=True)
+        try:
+            conversation_id, conversation = self.manage_conversation(session_id)
+            if not conversation:
+                raise ValueError("Invalid or missing conversation.")
+        except Exception as e:
+            print(f"Exception in manage_conversation: {e}", flush=True)
+            traceback.print_exc()
+            raise
+        if not conversation:
+            return {"error": "Conversation not found or unauthorized"}, 404
+
+        # History and the session's file list don't depend on each other or on
+        # the uploads below, so load them concurrently while files are processed.
+        executor = StagedExecutor(current_app._get_current_object(), self.stage_pool)
+        executor.spawn("history", self.get_conversation_history, conversation_id,
+                       limit=MAX_MESSAGES, with_token_counts=True,
+                       timeout=STAGE_TIMEOUTS["history"], default=([], []))
+        executor.spawn("summary", self.conversation_summary_cog.get_summary, conversation_id,
+                       timeout=STAGE_TIMEOUTS["summary"], default=(None, None))
+        executor.spawn("session_files", self.list_session_files, session_id,
+                       timeout=STAGE_TIMEOUTS["session_files"], default=None)
+
+        # Process uploaded files if present
+        print(flush=True)
+        uploaded_files = []
+        if files:
+            for file_item in files:
+                file_content, file_url, file_type, uploaded_file = process_uploaded_file(
+                    file=file_item,
+                    upload_folder=self.upload_folder,    # local fallback folder
+                    session_id=session_id,
+                    use_azure=self.use_azure,            # only True if we found a conn_str
+                    blob_service_client=self.blob_service_client,
+                    container_name=self.azure_container_name,
+                    conversation_id=conversation_id,
+                    commit=False,                        # committed with the turn's messages
+                    extract=False                        # text is extracted in the background
+                )
+                uploaded_files.append(uploaded_file)
 
-            # Retrieve system prompt
-            system_prompt = self.get_system_prompt()
+                print(f'file_url: {file_url}', flush=True)
+                print(f'uploaded_file.file_url: {uploaded_file.file_url}', flush=True)
 
-            # Retrieve other parameters (this will return files as a list if multipart/form-data)
-            message, model, temperature, files = self.get_request_parameters()
-            print(f"User Message: {message}", flush=True)
+            # Cached orchestration decisions no longer reflect this session's files
+            self.orchestration_analysis_cog.invalidate_session(session_id)
 
-            print(f"files: {files}")
+            # Files still to be read are extracted from their stored blob meanwhile; their rows
+            # stay in the turn's transaction and are settled once it commits
+            for uploaded_file in uploaded_files:
+                if uploaded_file.extraction_status == "pending":
+                    self.file_extraction_cog.submit(
+                        uploaded_file.content_sha256, uploaded_file.filename, uploaded_file.file_type
+                    )
 
-            # Manage conversation
-            print('Getting conversation ID.', flush=True)
+        print(flush=True)
+        print('File upload portion cleared.', flush=True)
+        if not message and not uploaded_files:
+            return {"error": "No message or file provided"}, 400
+
+        # The history stage already fetched just the newest MAX_MESSAGES
+        print('Getting conversation history.', flush=True)
+        conversation_history, history_token_counts = executor.result("history")
+
+        # Files listed before this turn's uploads were committed, plus the new uploads
+        session_files = executor.result("session_files")
+        if session_files is not None:
+            listed_ids = {row.id for row in session_files}
+            session_files = list(session_files) + [uf for uf in uploaded_files if uf.id not in listed_ids]
+
+        # If gpt-4o has to decide, generate search terms at the same time in case it picks web search
+        def start_search_terms():
+            executor.spawn("search_terms", self.web_search_cog.generate_search_terms,
+                           message, list(conversation_history),
+                           timeout=STAGE_TIMEOUTS["search_terms"], default=None)
+
+        # Analyze user orchestration
+        print('Sending for orchestration.', flush=True)
+        orchestration = self.orchestration_analysis_cog.analyze_user_orchestration(
+            user_message=message,
+            conversation_history=conversation_history,
+            session_id=session_id,
+            uploaded_files=session_files,
+            on_llm_call=start_search_terms if SPECULATIVE_SEARCH_TERMS and message else None
+        )
+        if not orchestration.get("internet_search"):
+            executor.cancel("search_terms")
+
+        if not message:
+            # If message is empty, acknowledge file upload(s)
+            file_names = ", ".join([uf.original_filename for uf in uploaded_files])
+            message = f'User is uploading file(s). Respond in acknowledgement that file(s) were uploaded. Here are the file names: {file_names}'
+
+        # Determine status message based on orchestration
+        if orchestration.get("internet_search"):
+            status_message = "Searching the internet..."
+        elif orchestration.get("image_generation"):
+            status_message = "Creating the image..."
+        elif orchestration.get("code_intent"):
+            status_message = "Processing your code request..."
+        elif orchestration.get("file_orchestration"):
+            status_message = "Analyzing the uploaded file..."
+        else:
+            status_message = "Assistant is thinking..."
+
+        # Emit status update via SocketIO
+        print(f'status_message: {status_message}', flush=True)
+        print(f'Emitting with session id: {session_id}', flush=True)
+        self.status_emitter.status(session_id, status_message)
+
+        action_kind = self.long_running_action(orchestration)
+        if background and action_kind:
+            # The job loads this turn's uploads in its own session, so they must be committed first
+            db.session.commit()
+            self.file_extraction_cog.settle(uploaded_files)
+            # Answer now; the job pushes progress and the result to the session room
             try:
-                conversation_id, conversation = self.manage_conversation(session_id)
-                if not conversation:
-                    raise ValueError("Invalid or missing conversation.")
-            except Exception as e:
-                print(f"Exception in manage_conversation: {e}", flush=True)
-                traceback.print_exc()
-                raise
-            if not conversation:
-                return jsonify({"error": "Conversation not found or unauthorized"}), 404
+                job_id = self.jobs_cog.submit(
+                    session_id, action_kind, self._run_chat_job,
+                    uploaded_file_ids=[uf.id for uf in uploaded_files],
+                    orchestration=orchestration,
+                    message=message,
+                    conversation_history=conversation_history,
+                    history_token_counts=history_token_counts,
+                    conversation_id=conversation_id,
+                    session_id=session_id,
+                    system_prompt=system_prompt,
+                    model=model,
+                    temperature=temperature,
+                    stream=stream,
+                    executor=executor
+                )
+            except JobQueueFull as e:
+                return {"error": str(e)}, 503
+            return {
+                "job_id": job_id,
+                "status": "queued",
+                "user_message": message,
+                "orchestration": orchestration,
+                "files": self.serialize_files(uploaded_files)
+            }, 202
+
+        payload, status = self._run_action(
+            orchestration=orchestration,
+            message=message,
+            conversation_history=conversation_history,
+            history_token_counts=history_token_counts,
+            conversation_id=conversation_id,
+            session_id=session_id,
+            uploaded_files=uploaded_files,
+            system_prompt=system_prompt,
+            model=model,
+            temperature=temperature,
+            stream=stream,
+            executor=executor
+        )
+        # save_turn has committed this turn's uploads
+        self.file_extraction_cog.settle(uploaded_files)
+        return payload, status
 
-            # Process uploaded files if present
-            print(flush=True)
-            uploaded_files = []
-            if files:
-                for file_item in files:
-                    file_content, file_url, file_type, uploaded_file = process_uploaded_file(
-                        file=file_item,
-                        upload_folder=self.upload_folder,    # local fallback folder
-                        session_id=session_id,
-                        use_azure=self.use_azure,            # only True if we found a conn_str
-                        blob_service_client=self.blob_service_client,
-                        container_name=self.azure_container_name,
-                        conversation_id=conversation_id
-                    )
-                    uploaded_files.append(uploaded_file)
+    def _run_socket_chat(self, request_id, params):
+        """
+        Background half of the `chat` socket event: run the turn and push the outcome to the
+        room as `chat_response` (or `chat_error`), tagged with the acked request_id.
+        """
+        try:
+            with self.flask_app.app_context():
+                payload, status = self.run_chat(params)
+        except Exception as e:
+            print(f"Error in chat socket event: {e}", flush=True)
+            traceback.print_exc()
+            payload, status = {"error": str(e)}, 500
+        # The client already has the history; everything else mirrors the /chat response body
+        payload = {key: value for key, value in payload.items() if key != "conversation_history"}
+        event = 'chat_error' if status >= 400 else 'chat_response'
+        self.status_emitter.emit(params["session_id"], event, {"request_id": request_id, "status": status, **payload})
+
+    def long_running_action(self, orchestration):
+        """
+        Name of the long-running action this orchestration triggers, or None for a plain reply.
+        Follows the same precedence as `_run_action`.
+        """
+        if orchestration.get("crm_review", False):
+            return "crm_review"
+        if orchestration.get("image_generation", False):
+            return "image_generation"
+        if orchestration.get("code_structure_orchestration", False):
+            return "code_structure_visualization"
+        if orchestration.get("internet_search", False):
+            return "internet_search"
+        return None
+
+    def _run_chat_job(self, job_id, uploaded_file_ids, **action_kwargs):
+        """
+        Job body for a backgrounded /chat action. Runs in its own app context, so this
+        turn's uploaded files are loaded again rather than reused from the request session.
+        """
+        uploaded_files = UploadedFile.query.filter(UploadedFile.id.in_(uploaded_file_ids)).all() if uploaded_file_ids else []
 
-                    print(f'file_url: {file_url}', flush=True)
-                    print(f'uploaded_file.file_url: {uploaded_file.file_url}', flush=True)
+        def progress(done, total):
+            self.jobs_cog.report_progress(job_id, {"done": done, "total": total})
 
+        payload, status = self._run_action(uploaded_files=uploaded_files, progress=progress, **action_kwargs)
+        if status >= 400:
+            raise RuntimeError(payload.get("error", "Chat action failed."))
+        return payload
 
-            print(flush=True)
-            print('File upload portion cleared.', flush=True)
-            if not message and not uploaded_files:
-                return jsonify({"error": "No message or file provided"}), 400
-
-            # Get conversation history and truncate if needed
-            print('Getting conversation history.', flush=True)
-            conversation_history = self.get_conversation_history(conversation_id)
-            if len(conversation_history) > MAX_MESSAGES:
-                conversation_history = conversation_history[-MAX_MESSAGES:]
-
-            # Analyze user orchestration
-            print('Sending for orchestration.', flush=True)
-            orchestration = self.orchestration_analysis_cog.analyze_user_orchestration(
+    def _run_action(self, orchestration, message, conversation_history, history_token_counts, conversation_id,
+                    session_id, uploaded_files, system_prompt, model, temperature, stream, executor, progress=None):
+        """
+        Carry out the orchestrated action for one turn and return (payload, status_code).
+        """
+        if orchestration.get("crm_review", False):
+            if not uploaded_files:
+                file_ids = orchestration.get("file_ids", [])
+                # Ensure that only the first 2 file IDs are used.
+                file_ids = file_ids[-2:]
+                # Retrieve the corresponding files from the DB using the provided file_ids.
+                uploaded_files = UploadedFile.query.filter(UploadedFile.id.in_(file_ids)).all()
+
+            payload, status = self.handle_crm(uploaded_files, message, conversation_history, orchestration, progress=progress)
+            # CRM reviews aren't added to the history, but this turn's uploads still need committing
+            self.save_turn(conversation_id, [])
+            print(f'response: {payload}', flush=True)
+            # self.socketio.emit('task_complete', {'answer': payload.get("assistant_reply", "")}, room=session_id)
+            return payload, status
+
+        elif orchestration.get("image_generation", False):
+            payload = self.handle_image_generation(orchestration, message, conversation_history, conversation_id)
+            print(f'response: {payload}', flush=True)
+            # Emit task completion
+            self.status_emitter.emit(session_id, 'task_complete', {'answer': payload.get("assistant_reply", "")})
+            return payload, 200
+        elif orchestration.get("code_structure_orchestration", False):
+            payload = self.handle_code_structure_visualization(orchestration, message, conversation_history, conversation_id)
+            # Emit task completion
+            self.status_emitter.emit(session_id, 'task_complete', {'answer': payload.get("assistant_reply", "")})
+            return payload, 200
+        else:
+            # Handle other orchestrations
+            supplemental_information, assistant_reply = self.handle_orchestration(
+                orchestration, session_id, conversation_id,
                 user_message=message,
                 conversation_history=conversation_history,
-                session_id=session_id
+                executor=executor
             )
 
-            if not message:
-                # If message is empty, acknowledge file upload(s)
-                file_names = ", ".join([uf.original_filename for uf in uploaded_files])
-                message = f'User is uploading file(s). Respond in acknowledgement that file(s) were uploaded. Here are the file names: {file_names}'
-
-            # Determine status message based on orchestration
-            if orchestration.get("internet_search"):
-                status_message = "Searching the internet..."
-            elif orchestration.get("image_generation"):
-                status_message = "Creating the image..."
-            elif orchestration.get("code_intent"):
-                status_message = "Processing your code request..."
-            elif orchestration.get("file_orchestration"):
-                status_message = "Analyzing the uploaded file..."
-            else:
-                status_message = "Assistant is thinking..."
-
-            # Emit status update via SocketIO
-            print(f'status_message: {status_message}', flush=True)
-            print(f'Emitting with session id: {session_id}', flush=True)
-            self.socketio.emit('status_update', {'message': status_message}, room=session_id)
+            # Prepare messages for OpenAI API
+            # Older turns arrive as a rolling summary in front of the recent tail
+            summary_message, summary_token_count = executor.result("summary")
+            messages = self.prepare_messages(system_prompt, conversation_history, supplemental_information, message,
+                                             summary_message=summary_message)
+
+            # Trim conversation if necessary (token-based). History and summary counts were stored at
+            # save time; only the system prompt, supplemental block and new message are counted now.
+            token_counts = (
+                [None]
+                + ([summary_token_count] if summary_message else [])
+                + history_token_counts
+                + ([None] if supplemental_information else [])
+                + [None]
+            )
+            messages = self.trim_conversation(messages, WORD_LIMIT, token_counts=token_counts)
 
-            if orchestration.get("crm_review", False):
-                if not uploaded_files:
-                    file_ids = orchestration.get("file_ids", [])
-                    # Ensure that only the first 2 file IDs are used.
-                    file_ids = file_ids[-2:]
-                    # Retrieve the corresponding files from the DB using the provided file_ids.
-                    uploaded_files = UploadedFile.query.filter(UploadedFile.id.in_(file_ids)).all()
-
-                response = self.handle_crm(uploaded_files, message, conversation_history, orchestration)
-                print(f'response: {response}', flush=True)
-                # self.socketio.emit('task_complete', {'answer': response.json.get("assistant_reply", "")}, room=session_id)
-                return response
-
-            elif orchestration.get("image_generation", False):
-                response = self.handle_image_generation(orchestration, message, conversation_history, conversation_id)
-                print(f'response: {response}', flush=True)
-                # Emit task completion
-                self.socketio.emit('task_complete', {'answer': response.json.get("assistant_reply", "")}, room=session_id)
-                return response
-            elif orchestration.get("code_structure_orchestration", False):
-                response = self.handle_code_structure_visualization(orchestration, message, conversation_history, conversation_id)
-                # Emit task completion
-                self.socketio.emit('task_complete', {'answer': response.json.get("assistant_reply", "")}, room=session_id)
-                return response
+            # Generate chat response, pushing tokens to the room as they arrive
+            if stream:
+                assistant_reply = generate_chat_response_stream(
+                    self.client, messages, model, temperature,
+                    on_delta=lambda delta: self.status_emitter.delta(session_id, delta)
+                )
             else:
-                # Handle other orchestrations
-                supplemental_information, assistant_reply = self.handle_orchestration(orchestration, session_id, conversation_id)
-
-                # Prepare messages for OpenAI API
-                messages = self.prepare_messages(system_prompt, conversation_history, supplemental_information, message)
-
-                # Trim conversation if necessary (token-based)
-                messages = self.trim_conversation(messages, WORD_LIMIT)
-
-                # Generate chat response
                 assistant_reply = generate_chat_response(self.client, messages, model, temperature)
 
-                # Save messages to the database
-                self.save_messages(conversation_id, "user", message)
-                self.save_messages(conversation_id, "assistant", assistant_reply)
+            # Save the turn (and its uploads) in one transaction once the full reply is in.
+            # A stream that broke off is saved with its STREAM_INTERRUPTED_MARKER, so later
+            # turns see the reply was incomplete.
+            self.save_turn(conversation_id, [("user", message), ("assistant", assistant_reply)])
 
-                # Emit task completion via SocketIO
-                self.socketio.emit('task_complete', {'answer': assistant_reply}, room=session_id)
+            # Emit task completion via SocketIO
+            self.status_emitter.emit(session_id, 'task_complete', {'answer': assistant_reply})
 
-                del messages
-                gc.collect()
+            del messages
+            gc.collect()
 
-                return jsonify({
-                    "user_message": message,
-                    "assistant_reply": assistant_reply,
-                    "conversation_history": conversation_history,  # truncated in memory above
-                    "orchestration": orchestration,
-                    "files": [
-                        {
-                            "fileUrl": uf.file_url,
-                            "fileName": uf.original_filename,
-                            "fileType": uf.file_type,
-                            "fileId": uf.id
-                        } for uf in uploaded_files
-                    ] if uploaded_files else None
-                }), 200
-
-        except Exception as e:
-            print(f"Error in /chat route: {e}", flush=True)
-            traceback.print_exc()
-            return jsonify({"error": str(e)}), 500
+            return {
+                "user_message": message,
+                "assistant_reply": assistant_reply,
+                "conversation_history": conversation_history,  # truncated in memory above
+                "orchestration": orchestration,
+                "files": self.serialize_files(uploaded_files)
+            }, 200
 
     def add_routes(self):
         @self.bp.route("/chat", methods=["POST"])
@@ -399,7 +602,8 @@ class ChatCog:
                     return jsonify({"error": "Conversation not found or unauthorized"}), 404
 
                 print('Getting conversation history.', flush=True)
-                conversation = self.get_conversation_history(conversation_id)
+                messages, has_more = self.get_recent_messages(conversation_id, MESSAGE_PAGE_SIZE)
+                conversation = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
                 
                 if not conversation:
                     print(f"No conversation found for session_id: {session_id}", flush=True)
@@ -410,7 +614,9 @@ class ChatCog:
                     "session_id": conversation_obj.session_id,
                     "title": conversation_obj.title,
                     "timestamp": conversation_obj.timestamp.isoformat() if conversation_obj.timestamp else None,
-                    "conversation_history": conversation  # NEW: Include full history
+                    "conversation_history": conversation,  # Newest MESSAGE_PAGE_SIZE messages
+                    "has_more": has_more,  # Older pages via /conversations/<id>/messages?before=<next_before>
+                    "next_before": messages[0]["id"] if has_more else None
                 }
                     
                 return jsonify({"conversation": data}), 200
@@ -420,6 +626,41 @@ class ChatCog:
                 traceback.print_exc()
                 return jsonify({"error": "Failed to retrieve conversation"}), 500
 
+        @self.bp.route("/conversations/<int:conversation_id>/messages", methods=["GET"])
+        def get_conversation_messages(conversation_id):
+            """
+            Page back through a conversation, newest first by page.
+            Pass the returned `next_before` as `before` to fetch the previous page.
+            """
+            try:
+                session_id = request.args.get("session_id")
+                if not session_id:
+                    return jsonify({"error": "Session ID is required"}), 400
+                conversation = Conversation.query.filter_by(id=conversation_id, session_id=session_id).first()
+                if not conversation:
+                    return jsonify({"error": "Conversation not found or unauthorized"}), 404
+
+                before_id = request.args.get("before", type=int)
+                limit = min(max(request.args.get("limit", MESSAGE_PAGE_SIZE, type=int), 1), MAX_MESSAGE_PAGE_SIZE)
+                messages, has_more = self.get_message_page(conversation_id, limit, before_id=before_id)
+                return jsonify({
+                    "messages": [
+                        {
+                            "id": msg.id,
+                            "role": msg.role,
+                            "content": msg.content,
+                            "timestamp": msg.timestamp.isoformat() if msg.timestamp else None
+                        } for msg in messages
+                    ],
+                    "has_more": has_more,
+                    "next_before": messages[0].id if has_more else None
+                }), 200
+
+            except Exception as e:
+                print(f"Error retrieving conversation messages: {e}", flush=True)
+                traceback.print_exc()
+                return jsonify({"error": "Failed to retrieve messages"}), 500
+
         @self.bp.route("/conversations/new", methods=["POST"])
         def create_new_conversation():
             """
@@ -451,97 +692,91 @@ class ChatCog:
 
         @self.bp.route("/ping", methods=["GET"])
         def ping():
-            try:
-                db.session.execute("SELECT 1")  # quick check
-                return "OK", 200
-            except:
-                db.session.rollback()
-                return "DB Connection Lost, Reset", 500
+            # Cached result of the background probe; no DB round trip per request
+            if db_health.healthy is False:
+                return jsonify({"status": "degraded", "db": db_health.status()}), 503
+            return "OK", 200
 
     # Additional Helper Methods
 
-    def get_system_prompt(self):
-        if request.content_type.startswith('multipart/form-data'):
-            return request.form.get("system_prompt", "You are a USMC AI agent. Provide relevant responses.")
-        elif request.is_json:
-            try:
-                data = request.get_json()
-                if not data:
-                    return jsonify({"error": "Invalid JSON payload"}), 400
-            except Exception as e:
-                return jsonify({"error": f"Malformed JSON: {str(e)}"}), 400
-            return data.get("system_prompt", "You are a USMC AI agent. Provide relevant responses.")
-        else:
-            return "You are a USMC AI agent. Provide relevant responses."
-
-    def get_request_parameters(self):
-        if request.content_type.startswith('multipart/form-data'):
-            message = request.form.get("message", "")
-            model = request.form.get("model", "gpt-4o-mini")
-            try:
-                temperature = float(request.form.get("temperature", 0.7))
-            except ValueError:
-                temperature = 0.7
-            files = request.files.getlist("files")
-        elif request.is_json:
-            try:
-                data = request.get_json()
-                if not data:
-                    return jsonify({"error": "Invalid JSON payload"}), 400
-            except Exception as e:
-                return jsonify({"error": f"Malformed JSON: {str(e)}"}), 400
-            message = data.get("message", "")
-            model = data.get("model", "gpt-4o-mini")
-            try:
-                temperature = float(data.get("temperature", 0.7))
-            except ValueError:
-                temperature = 0.7
-            files = None
-        else:
-            message = ""
-            model = "gpt-4o-mini"
+    def get_request_data(self):
+        """
+        The /chat request's fields and uploaded files, from a multipart form or a JSON body.
+        """
+        if request.mimetype == 'multipart/form-data':
+            return request.form.to_dict(), request.files.getlist("files")
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not data:
+                raise ValueError("Invalid JSON payload")
+            return data, None
+        raise ValueError("Unsupported Content-Type")
+
+    def get_chat_params(self, data, files=None):
+        """
+        Normalize one turn's fields (an HTTP form/JSON body or a `chat` socket payload)
+        into the params dict `run_chat` takes.
+        """
+        session_id = data.get("room")
+        if not session_id:
+            session_id = str(uuid.uuid4())  # Generate a new session ID if missing
+            print(f"Generated new session_id for chat: {session_id}", flush=True)
+        try:
+            temperature = float(data.get("temperature", 0.7))
+        except (TypeError, ValueError):
             temperature = 0.7
-            files = None
-        return message, model, temperature, files
+        return {
+            "session_id": session_id,
+            "message": data.get("message") or "",
+            "model": data.get("model") or "gpt-4o-mini",
+            "temperature": temperature,
+            "system_prompt": data.get("system_prompt") or DEFAULT_SYSTEM_PROMPT,
+            "files": files or None,
+            "stream": self.parse_flag(data.get("stream"), STREAM_RESPONSES),
+            "background": self.parse_flag(data.get("background"), BACKGROUND_JOBS),
+        }
+
+    @staticmethod
+    def parse_flag(value, default):
+        """
+        Read an optional boolean field (e.g. "stream", "background"); form fields arrive as strings.
+        """
+        if value is None:
+            return default
+        return str(value).lower() in ("1", "true", "yes", "on")
 
-    def get_or_create_conversation(self, session_id, title="New Conversation", limit=100):
+    @staticmethod
+    def serialize_files(uploaded_files):
+        return [
+            {
+                "fileUrl": uf.file_url,
+                "fileName": uf.original_filename,
+                "fileType": uf.file_type,
+                "fileId": uf.id,
+                "extractionStatus": uf.extraction_status or "ready"
+            } for uf in uploaded_files
+        ] if uploaded_files else None
+
+    def get_or_create_conversation(self, session_id, title="New Conversation"):
         """
         Fetch an existing conversation by session_id or create a new one.
         """
         try:
-            print(f"[get_or_create_conversation] Querying for session_id: {session_id}")
-            
-            if db.session.query(Conversation).filter_by(session_id=session_id).first() is not None:
-                conversation = Conversation.query.filter_by(session_id=session_id).execution_options(timeout=5).first()
-            else:
-                conversation = None
-            
-            if conversation:
-                print(f"[get_or_create_conversation] Found conversation ID: {conversation.id}")
-            else:
-                print(f"[get_or_create_conversation] No conversation found for session_id: {session_id}. Creating a new one.")
-                conversation = Conversation(session_id=session_id, title=title)
-                db.session.add(conversation)
-                print(f"[get_or_create_conversation] Added new conversation to session.")
-                db.session.commit()  # Save changes to the database
-        
-            return conversation
-        
+            return ConversationManagement.get_or_create_conversation(session_id, title=title)
         except Exception as e:
-            # Handle potential database issues
-            db.session.rollback()  # Rollback the transaction in case of failure
+            db.session.rollback()
             print(f"[get_or_create_conversation] Failed to get or create conversation: {e}")
             traceback.print_exc()
             raise
 
-    def handle_crm(self, uploaded_files, message, conversation_history, orchestration):
+    def handle_crm(self, uploaded_files, message, conversation_history, orchestration, progress=None):
         # Identify the document and CRM files
         document_path = None
         crm_file_path = None
         print(f'uploaded_files: {uploaded_files}', flush=True)
         for uploaded_file in uploaded_files:
-            # Assuming `uploaded_file` has a `filename` attribute
-            filename = uploaded_file.filename.lower()  # Normalize case for comparison
+            # `filename` is the content-addressed blob name; the user's name says which file is the CRM
+            filename = uploaded_file.original_filename.lower()  # Normalize case for comparison
             print(f'filename: {filename}', flush=True)
             if filename.endswith((".pdf", ".docx")):
                 document_path = uploaded_file.file_url
@@ -550,9 +785,9 @@ class ChatCog:
 
         # Check if both files are identified
         if not document_path:
-            return jsonify({"error": "No document file (PDF or Word) was uploaded."}), 400
+            return {"error": "No document file (PDF or Word) was uploaded."}, 400
         if not crm_file_path:
-            return jsonify({"error": "No CRM file (Excel or CSV) was uploaded."}), 400
+            return {"error": "No CRM file (Excel or CSV) was uploaded."}, 400
         
         print('calling process_stakeholder_feedback...', flush=True)
         assistant_reply = process_stakeholder_feedback(
@@ -560,103 +795,118 @@ class ChatCog:
             crm_file_path,
             model="gpt-4o-mini",
             temperature=0,  # e.g. 0.7
-            openai_client=openai        # your configured openai module/client
+            openai_client=openai,        # your configured openai module/client
+            progress=progress
         )
 
 
         print(f'assistant_reply: {assistant_reply}', flush=True)
-        return jsonify({
+        return {
             "user_message": message,
             "assistant_reply": assistant_reply,
             "conversation_history": conversation_history,  # truncated in memory above
             "orchestration": orchestration,
-            "files": [
-                {
-                    "fileUrl": uf.file_url,
-                    "fileName": uf.original_filename,
-                    "fileType": uf.file_type,
-                    "fileId": uf.id
-                } for uf in uploaded_files
-            ] if uploaded_files else None
-        }), 200
-
-
-    def manage_conversation(self, session_id, limit=100):
+            "files": self.serialize_files(uploaded_files)
+        }, 200
+
+
+    def manage_conversation(self, session_id):
         """
         Fetches or creates a conversation based on session_id.
         Returns a tuple of (conversation_id, Conversation object).
         """
-        try:
-            print(f"[manage_conversation] Managing conversation for session_id: {session_id}")
-            # Insert a dummy conversation with a non-null title
-            dummy = Conversation(session_id="dummy_for_warmup", title="dummy_title", timestamp=datetime.utcnow())
-            db.session.add(dummy)
-            db.session.flush()  # or db.session.commit()
-
-            # Now optionally roll back if you don't want to keep this record:
-            db.session.rollback()
-
-            # Optionally roll back the dummy change if it's not needed:
-            db.session.rollback()
-            if db.session.query(Conversation).filter_by(session_id=session_id).first() is not None:
-                try:
-                    with Timeout(30):
-                        conversation = db.session.query(Conversation).filter_by(session_id=session_id).execution_options(timeout=5).first()
-                except Timeout:
-                    # Handle the timeout (e.g., log, retry, or return an error)
-                    conversation = None
-                print(f"[manage_conversation] conversation found => ID: {conversation.id if conversation else None}", flush=True)
-            else:
-                conversation = None
-
-            # If no conversation is found, create a new one
-            if not conversation:
-                print(f"[manage_conversation] No conversation found for session_id: {session_id}. Creating a new one.", flush=True)
-                conversation = Conversation(session_id=session_id, title="New Conversation")
-                db.session.add(conversation)
-                db.session.commit()  # commit the create
-                print(f"[manage_conversation] Created new conversation with ID: {conversation.id}", flush=True)
-            else:
-                # Optionally refresh the conversation
-                db.session.refresh(conversation)
-                print(f"[manage_conversation] Retrieved conversation ID: {conversation.id}", flush=True)
+        conversation_id, conversation = ConversationManagement.manage_conversation(session_id)
+        print(f"[manage_conversation] session_id: {session_id} => conversation ID: {conversation_id}", flush=True)
+        return conversation_id, conversation
 
-            return conversation.id, conversation
+    def get_message_page(self, conversation_id, limit, before_id=None):
+        """
+        Return (messages, has_more): up to `limit` of the newest messages older than
+        `before_id` (or the newest overall), oldest first.
 
-        except Exception as e:
-            db.session.rollback()  # Make sure to rollback on error
-            print(f"[manage_conversation] Error: {e}")
-            traceback.print_exc()
-            return None, None
+        Walks the (timestamp, id) order backwards from the cursor in one indexed query,
+        fetching one extra row to tell whether an older page exists.
+        """
+        query = Message.query.filter(Message.conversation_id == conversation_id)
+        if before_id is not None:
+            cursor_timestamp = (
+                db.session.query(Message.timestamp)
+                .filter(Message.id == before_id, Message.conversation_id == conversation_id)
+                .scalar_subquery()
+            )
+            query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(cursor_timestamp, before_id))
+        rows = (
+            query
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(rows) > limit
+        return rows[:limit][::-1], has_more
 
-    def get_conversation_history(self, conversation_id, limit=50, offset=0):
+    def get_recent_messages(self, conversation_id, limit):
         """
-        Retrieve messages from the database with pagination and return them as a list of {role, content}.
+        Return (messages, has_more) for the newest `limit` messages, oldest first, as dicts with
+        id, role, content and token_count. Served from the history cache when it is warm.
+        """
+        cached = self.history_cache.get(conversation_id, limit)
+        if cached is not None:
+            return cached
+
+        token = self.history_cache.begin_fill(conversation_id)
+        # Then the shared cache, which another worker may have filled
+        scope = f"history:{conversation_id}"
+        version = self.cache_backend.version(scope)
+        shared = self.cache_backend.get_versioned(scope, version)
+        if shared is not None and (len(shared["messages"]) >= limit or not shared["has_more"]):
+            messages, has_more = shared["messages"], shared["has_more"]
+        else:
+            rows, has_more = self.get_message_page(conversation_id, max(limit, self.history_cache.window))
+            messages = [
+                {"id": row.id, "role": row.role, "content": row.content, "token_count": row.token_count}
+                for row in rows
+            ]
+            self.cache_backend.set_versioned(scope, {"messages": messages, "has_more": has_more}, version,
+                                             ttl=HISTORY_SHARED_TTL)
+        self.history_cache.fill(conversation_id, messages, has_more, token)
+
+        recent = messages[-limit:] if limit else []
+        return recent, has_more or len(messages) > len(recent)
+
+    def get_conversation_history(self, conversation_id, limit=50, with_token_counts=False):
+        """
+        Retrieve the newest `limit` messages and return them oldest first as a list of {role, content}.
+        With `with_token_counts=True`, returns (history, token_counts) where token_counts holds each
+        message's stored count (None for rows saved before counts were recorded).
         """
         try:
-            if db.session.query(Message).filter_by(conversation_id=conversation_id).first() is not None:
-                messages_db = (
-                    Message.query
-                    .filter_by(conversation_id=conversation_id)
-                    .order_by(Message.timestamp)
-                    .offset(offset)
-                    .limit(limit)
-                    .all()
-                )
-            else:
-                print(f"Error fetching conversation history.", flush=True)
-                return []
-            return [{"role": msg.role, "content": msg.content} for msg in messages_db]
+            messages, _ = self.get_recent_messages(conversation_id, limit)
+            history = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+            if with_token_counts:
+                return history, [msg["token_count"] for msg in messages]
+            return history
         except Exception as e:
             print(f"Error fetching conversation history: {e}", flush=True)
-            return []
+            return ([], []) if with_token_counts else []
 
-    def handle_orchestration(self, orchestration, session_id=None, conversation_id=None):
+    def list_session_files(self, session_id):
+        """
+        Return (id, original_filename) rows for the files uploaded in this session.
+        """
+        return (
+            db.session.query(UploadedFile.id, UploadedFile.original_filename)
+            .filter_by(session_id=session_id)
+            .all()
+        )
+
+    def handle_orchestration(self, orchestration, session_id=None, conversation_id=None,
+                             user_message=None, conversation_history=None, executor=None):
         supplemental_information = {}
         assistant_reply = ""
         
         if orchestration.get("file_orchestration", False):
-            supplemental_information, assistant_reply = self.handle_file_orchestration(orchestration, session_id)
+            supplemental_information, assistant_reply = self.handle_file_orchestration(orchestration, session_id,
+                                                                                       user_message=user_message)
             
         elif orchestration.get("code_orchestration", False):
             code_content = self.code_files_cog.get_all_code_files_content()
@@ -670,8 +920,12 @@ class ChatCog:
             else:
                 assistant_reply = "No code files found to provide."
         elif orchestration.get("internet_search", False):
-            query = request.json.get("message", "")
-            search_content = self.web_search_cog.web_search(query, self.get_conversation_history(conversation_id))
+            query = user_message if user_message is not None else request.json.get("message", "")
+            if conversation_history is None:
+                conversation_history = self.get_conversation_history(conversation_id)
+            # Search terms generated alongside orchestration, if that stage ran
+            optimized_query = executor.result("search_terms") if executor is not None else None
+            search_content = self.web_search_cog.web_search(query, conversation_history, optimized_query=optimized_query)
             sys_search_content = (
                 'Do not say "I am unable to browse the internet," because you have information directly retrieved from the internet. '
                 'Give a confident answer based on the suplimented information. Only use the most relevant and accurate information that matches the User Query. '
@@ -696,13 +950,17 @@ class ChatCog:
                 assistant_reply = "Please provide a valid range for the random number."
         return supplemental_information, assistant_reply
         
-    def handle_file_orchestration(self, orchestration, session_id):
+    def handle_file_orchestration(self, orchestration, session_id, user_message=None):
         """
         Handle file orchestration based on the orchestration instructions.
 
+        Requested files are included whole while their text totals at most RETRIEVAL_FULL_TEXT_WORDS
+        words; past that, the top chunks for `user_message` from the retrieval index are sent instead.
+
         Args:
             orchestration (dict): The orchestration JSON object containing directives.
             session_id (str): The current session ID.
+            user_message (str): The message the files are being asked about.
 
         Returns:
             tuple: A tuple containing supplemental information (dict) and assistant reply (str).
@@ -767,36 +1025,9 @@ class ChatCog:
                     assistant_reply = "No valid uploaded files found for the requested file IDs."
                 return supplemental_information, assistant_reply
 
-            # Determine the number of valid requested files
-            num_requested_files = len(valid_requested_file_ids)
-            print(f"Number of valid requested files: {num_requested_files}", flush=True)
-
-            if num_requested_files > 3:
-                # More than 3 files requested: only list file names
-                print("More than 3 files requested. Listing file names without contents.", flush=True)
-                try:
-                    file_list_str = "\n".join([f"- {uploaded_file_ids[fid].original_filename} (ID: {fid})" for fid in valid_requested_file_ids])
-                    print("Constructed file_list_str for multiple specific files:", file_list_str, flush=True)
-                    assistant_reply = f"Here are the requested file names:\n{file_list_str}\n\nNote: File contents are not displayed as more than 3 files were requested."
-                    supplemental_information = {
-                        "role": "system",
-                        "content": (
-                            '\n\nYou are being supplemented with the following information.\n'
-                            f"List of requested file names:\n***{file_list_str}***"
-                        )
-                    }
-                    # If there are invalid file IDs, append them to the assistant reply
-                    if invalid_file_ids:
-                        print("Appending information about invalid file_ids.", flush=True)
-                        assistant_reply += f"\nAdditionally, the following requested file IDs are invalid: {', '.join(invalid_file_ids)}."
-                except Exception as e:
-                    print(f"Error constructing file list for multiple specific files: {e}", flush=True)
-                    assistant_reply = "An error occurred while listing the requested files."
-                return supplemental_information, assistant_reply
-
-            # If 1-3 files are requested: include file names and contents
-            print("1-3 files requested. Including file names and contents.", flush=True)
-            file_contents = []
+            # Read each requested file's text
+            print(f"Reading {len(valid_requested_file_ids)} requested file(s).", flush=True)
+            file_texts = []
             errors = []
 
             for fid in valid_requested_file_ids:
@@ -804,33 +1035,50 @@ class ChatCog:
                 if uploaded_file:
                     file_path = os.path.join(self.upload_folder, uploaded_file.filename)
                     print(f"Processing file: {uploaded_file.original_filename} (ID: {fid}) at path: {file_path}", flush=True)
-                    if os.path.exists(file_path):
-                        try:
-                            print(f"File exists. Processing file: {uploaded_file.original_filename}", flush=True)
-                            # Process the uploaded file (adjust parameters as needed)
-                            # read=True => means read from local path
-                            file_content = process_uploaded_file(
-                                file=None,
-                                upload_folder=self.upload_folder,
-                                session_id=uploaded_file.session_id,
-                                read=True,
-                                path=file_path,
-                                use_azure=self.use_azure,
-                                blob_service_client=self.blob_service_client,
-                                container_name=self.azure_container_name
-                            )
-                            print(f"Successfully processed file: {uploaded_file.original_filename}", flush=True)
-                            file_contents.append((uploaded_file.original_filename, file_content))
-                        except Exception as e:
-                            print(f"Error processing file {uploaded_file.original_filename}: {e}", flush=True)
-                            errors.append(f"Error processing file '{uploaded_file.original_filename}'.")
+                    try:
+                        if uploaded_file.extraction_status == "pending":
+                            # Uploaded moments ago: wait for this file's text only
+                            self.status_emitter.status(session_id, f"Reading {uploaded_file.original_filename}...")
+                            self.file_extraction_cog.wait_until_ready(uploaded_file)
+                        # Stored text by content hash; the file itself is only needed for older uploads
+                        file_content = self.read_file_text(uploaded_file, file_path)
+                    except Exception as e:
+                        print(f"Error processing file {uploaded_file.original_filename}: {e}", flush=True)
+                        errors.append(f"Error processing file '{uploaded_file.original_filename}'.")
                     else:
-                        print(f"File not found on server: {uploaded_file.original_filename}", flush=True)
-                        errors.append(f"File '{uploaded_file.original_filename}' not found on server.")
+                        if file_content is None:
+                            print(f"File not found on server: {uploaded_file.original_filename}", flush=True)
+                            errors.append(f"File '{uploaded_file.original_filename}' not found on server.")
+                        elif file_content in EXTRACTION_ERRORS:
+                            print(f"No text could be extracted from: {uploaded_file.original_filename}", flush=True)
+                            errors.append(f"Could not read the contents of '{uploaded_file.original_filename}'.")
+                        else:
+                            print(f"Successfully processed file: {uploaded_file.original_filename}", flush=True)
+                            file_texts.append((uploaded_file, file_content))
                 else:
                     print(f"Uploaded file with ID '{fid}' not found.", flush=True)
                     errors.append(f"Uploaded file with ID '{fid}' not found.")
 
+            # Small files go in whole; otherwise only the passages most relevant to the message
+            file_contents = []
+            total_words = sum(len(content.split()) for _, content in file_texts)
+            if file_texts and total_words <= RETRIEVAL_FULL_TEXT_WORDS:
+                print(f"Including full contents ({total_words} words).", flush=True)
+                file_contents = [(uf.original_filename, content) for uf, content in file_texts]
+            elif file_texts:
+                # Searched by position in file_texts; the same content uploaded twice is searched once
+                searched = {}
+                for index, (uf, content) in enumerate(file_texts):
+                    searched.setdefault(uf.content_sha256, (uf.content_sha256, index, lambda content=content: content))
+                matches = self.retrieval_index.search(user_message or "", searched.values())
+                # Excerpts in document order, file by file
+                matches.sort(key=lambda match: (match[1], match[2]))
+                print(f"Including {len(matches)} excerpt(s) retrieved from {total_words} words.", flush=True)
+                file_contents = [
+                    (f"{file_texts[index][0].original_filename} (excerpt {number})", chunk)
+                    for _score, index, number, chunk in matches
+                ]
+
             # Construct the assistant reply with file contents
             if file_contents:
                 print("Constructing assistant reply with file contents.", flush=True)
@@ -881,9 +1129,35 @@ class ChatCog:
             print('Error:', e)
             return supplemental_information, assistant_reply
             
+    def read_file_text(self, uploaded_file, file_path):
+        """
+        Extracted text of a stored upload, or None if there is neither stored text nor a local copy.
+        Text is kept once per content hash (normally since upload time) and shared through the
+        cache backend; only uploads that predate content hashing are parsed here, once.
+        """
+        content_sha256 = uploaded_file.content_sha256
+        if content_sha256:
+            cache_key = f"file_text:{content_sha256}"
+            file_content = self.cache_backend.get(cache_key)
+            if file_content is None:
+                file_content = get_extracted_text(content_sha256)
+                if file_content is not None:
+                    self.cache_backend.set(cache_key, file_content, ttl=FILE_TEXT_CACHE_TTL)
+            if file_content is not None:
+                return file_content
+
+        if not os.path.exists(file_path):
+            return None
+        # Older upload: hash and parse it once; the row and text are committed with the turn
+        content_sha256 = content_sha256 or sha256_file(file_path)
+        file_content = get_or_extract_text(content_sha256, lambda: read_file_content(file_path))
+        uploaded_file.content_sha256 = content_sha256
+        self.cache_backend.set(f"file_text:{content_sha256}", file_content, ttl=FILE_TEXT_CACHE_TTL)
+        return file_content
+
     def handle_image_generation(self, orchestration, user_message, conversation_history, conversation_id):
         """
-        Handles image generation and returns a response immediately.
+        Handles image generation and returns the response payload.
         """
         supplemental_information = {}
         assistant_reply = ""
@@ -891,14 +1165,12 @@ class ChatCog:
         if prompt:
             image_url = generate_image(prompt, self.client)
             assistant_reply = f"![Generated Image]({image_url})"
-            conversation_history.append({"role": "assistant", "content": assistant_reply})
-            self.save_messages(conversation_id, "assistant", assistant_reply)
         else:
             assistant_reply = "No image prompt provided."
-            conversation_history.append({"role": "assistant", "content": assistant_reply})
-            self.save_messages(conversation_id, "assistant", assistant_reply)
-        
-        return jsonify({
+        conversation_history.append({"role": "assistant", "content": assistant_reply})
+        self.save_turn(conversation_id, [("user", user_message), ("assistant", assistant_reply)])
+
+        return {
             "user_message": user_message,
             "assistant_reply": assistant_reply,
             "conversation_history": conversation_history,
@@ -906,24 +1178,22 @@ class ChatCog:
             "fileUrl": None,
             "fileName": None,
             "fileType": None
-        })
+        }
 
     def handle_code_structure_visualization(self, orchestration, user_message, conversation_history, conversation_id):
         """
-        Handles code structure visualization and returns a response immediately.
+        Handles code structure visualization and returns the response payload.
         """
         supplemental_information = {}
         assistant_reply = ""
         image_url = self.code_structure_visualizer_cog.generate_codebase_structure_diagram()
         if image_url:
             assistant_reply = f"![Codebase Structure]({image_url})"
-            conversation_history.append({"role": "assistant", "content": assistant_reply})
-            self.save_messages(conversation_id, "assistant", assistant_reply)
         else:
             assistant_reply = "Failed to generate codebase structure diagram."
-            conversation_history.append({"role": "assistant", "content": assistant_reply})
-            self.save_messages(conversation_id, "assistant", assistant_reply)
-        
+        conversation_history.append({"role": "assistant", "content": assistant_reply})
+        self.save_turn(conversation_id, [("user", user_message), ("assistant", assistant_reply)])
+
         # Optionally add code content
         code_content = self.code_files_cog.get_all_code_files_content()
         if code_content:
@@ -934,7 +1204,7 @@ class ChatCog:
                 )
             }
         
-        return jsonify({
+        return {
             "user_message": user_message,
             "assistant_reply": assistant_reply,
             "conversation_history": conversation_history,
@@ -942,9 +1212,10 @@ class ChatCog:
             "fileUrl": None,
             "fileName": None,
             "fileType": None
-        })
+        }
 
-    def prepare_messages(self, system_prompt, conversation_history, supplemental_information, user_message):
+    def prepare_messages(self, system_prompt, conversation_history, supplemental_information, user_message,
+                         summary_message=None):
         additional_instructions = (
             "Generate responses as structured and easy-to-read.  \n"
             "Provide responses using correct markdown formatting. It is critical that markdown format is used.  \n"
@@ -956,7 +1227,10 @@ class ChatCog:
                 "role": "system", 
                 "content": f"Your role is:\n{system_prompt} \n\nStructured response Guidelines:\n{additional_instructions}"
             }
-        ] + conversation_history
+        ]
+        if summary_message:
+            messages.append(summary_message)
+        messages += conversation_history
 
         if supplemental_information:
             messages.append(supplemental_information)
@@ -964,36 +1238,75 @@ class ChatCog:
         messages.append({"role": "user", "content": user_message})
         return messages
 
-    def trim_conversation(self, messages, max_tokens=WORD_LIMIT):
+    def trim_conversation(self, messages, max_tokens=WORD_LIMIT, token_counts=None):
         """
         Trim the conversation by token count if it exceeds WORD_LIMIT.
+
+        `token_counts` is aligned with `messages`; entries that are None (or a missing
+        list) are counted here, stored counts are used as-is.
         """
-        
-        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        if token_counts is None:
+            token_counts = [None] * len(messages)
+
         total_tokens = 0
-        trimmed = []
-        
-        for message in reversed(messages):
-            message_tokens = len(encoding.encode(json.dumps(message)))
+        start = len(messages)
+
+        # Walk back from the newest message and keep the longest suffix that fits
+        for index in range(len(messages) - 1, -1, -1):
+            message_tokens = token_counts[index]
+            if message_tokens is None:
+                message_tokens = count_message_tokens(messages[index])
             if total_tokens + message_tokens > max_tokens:
                 break
-            trimmed.insert(0, message)
             total_tokens += message_tokens
-        
+            start = index
+
+        trimmed = messages[start:]
         if not trimmed and messages:
-            trimmed.append(messages[-1])
-        
+            trimmed = [messages[-1]]
+
         return trimmed
 
-    def save_messages(self, conversation_id, role, content):
-        """Save a message to the database."""
-        msg = Message(
-            conversation_id=conversation_id,
-            role=role,
-            content=content
-        )
-        db.session.add(msg)
-        db.session.commit()
+    def save_turn(self, conversation_id, messages):
+        """
+        Save a turn's (role, content) messages, recording their token counts, in one
+        transaction together with anything else pending in the session (this turn's
+        UploadedFile rows), so a turn is stored completely or not at all. If the turn fails
+        first, its uploads are rolled back with it; only their content-addressed blobs (and
+        any text extracted from them) remain, to be reused if the same file is uploaded again.
+        Turns handed to a background job are the exception: run_chat commits their uploads
+        before queueing the job, which saves the messages later.
+        """
+        try:
+            rows = [
+                Message(
+                    conversation_id=conversation_id,
+                    role=role,
+                    content=content,
+                    token_count=count_message_tokens({"role": role, "content": content})
+                ) for role, content in messages
+            ]
+            db.session.add_all(rows)
+            # Flush for the IDs now; reading them after commit would reload every row
+            db.session.flush()
+            saved = [
+                {"id": row.id, "role": row.role, "content": row.content, "token_count": row.token_count}
+                for row in rows
+            ]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if saved:
+            self.history_cache.append(conversation_id, saved)
+            # Other workers drop their copies and refill from the database
+            self.cache_backend.bump_version(f"history:{conversation_id}", ttl=HISTORY_SHARED_TTL)
+            self.cache_backend.publish("history", {"conversation_id": conversation_id})
+
+        # A finished turn may push older messages out of the recent window
+        if any(role == "assistant" for role, _ in messages):
+            self.conversation_summary_cog.schedule(conversation_id)
 
 
 
@@ -1,22 +1,78 @@
 # cogs/conversation_management.py
 
 import traceback
-from db import db
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from db import db, UPSERT_INSERTS
 from models import Conversation, Message
 
+
 class ConversationManagement:
+    @staticmethod
+    def get_or_create_conversation(session_id, title="New Conversation"):
+        """
+        Return the Conversation for session_id, creating it if it doesn't exist.
+
+        An existing conversation costs one SELECT. A new one is created with a single
+        INSERT ... ON CONFLICT (session_id) DO NOTHING RETURNING, which also makes
+        concurrent first requests for the same session safe: the loser of the race
+        gets no row back and reads the winner's with one more SELECT. The new row is
+        kept out of the session while committing, so the commit doesn't expire the
+        values RETURNING loaded and reading them later costs no SELECT.
+        """
+        query = select(Conversation).where(Conversation.session_id == session_id)
+        conversation = db.session.execute(query).scalar_one_or_none()
+        if conversation is not None:
+            return conversation
+
+        values = {"session_id": session_id, "title": title, "timestamp": datetime.utcnow()}
+        upsert_insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+        if upsert_insert is not None:
+            stmt = (
+                upsert_insert(Conversation)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=[Conversation.session_id])
+                .returning(Conversation)
+            )
+            conversation = db.session.execute(stmt).scalar_one_or_none()
+            ConversationManagement._commit_loaded(conversation)
+        else:
+            try:
+                conversation = Conversation(**values)
+                db.session.add(conversation)
+                db.session.flush()
+                ConversationManagement._commit_loaded(conversation)
+            except IntegrityError:
+                db.session.rollback()
+                conversation = None
+
+        if conversation is None:
+            # Another request created it between our SELECT and INSERT
+            conversation = db.session.execute(query).scalar_one()
+        return conversation
+
+    @staticmethod
+    def _commit_loaded(instance):
+        """
+        Commit, keeping `instance`'s loaded attributes (commit expires everything in the session).
+        """
+        if instance is None:
+            db.session.commit()
+            return
+        db.session.expunge(instance)
+        db.session.commit()
+        db.session.add(instance)
+
     @staticmethod
     def manage_conversation(session_id):
         """
         Fetch or create a conversation by session_id.
         """
         try:
-            conversation = Conversation.query.filter_by(session_id=session_id).first()
-            if not conversation:
-                conversation = Conversation(session_id=session_id, title="New Conversation")
-                db.session.add(conversation)
-                db.session.commit()
-                db.session.refresh(conversation)
+            conversation = ConversationManagement.get_or_create_conversation(session_id)
             return conversation.id, conversation
         except Exception as e:
             db.session.rollback()
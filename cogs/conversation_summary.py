@@ -0,0 +1,128 @@
+# cogs/conversation_summary.py
+import os
+import traceback
+
+import eventlet
+from db import db
+from models import ConversationSummary, Message
+from utils.token_utils import count_message_tokens
+
+# Fold older messages into the summary once this many have fallen out of the kept window
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "6"))
+# Most messages folded in one call, so a long thread with no summary yet is caught up over several
+SUMMARY_MAX_FOLD = max(int(os.getenv("SUMMARY_MAX_FOLD", "40")), SUMMARY_BATCH)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 500
+
+
+class ConversationSummaryCog:
+    """
+    Keeps a rolling per-conversation summary of the turns that no longer fit in the
+    recent window sent to the model.
+
+    Messages older than the newest `keep_recent` are folded into the summary in
+    batches of SUMMARY_BATCH (at most SUMMARY_MAX_FOLD per model call). `keep_recent`
+    is chosen so that the recent window (`recent_window` messages) always reaches back
+    to the summarized part, so no message is ever in neither the summary nor the window.
+    """
+
+    def __init__(self, openai_client, flask_app, recent_window):
+        self.client = openai_client
+        self.flask_app = flask_app
+        self.keep_recent = max(recent_window - SUMMARY_BATCH + 1, 1)
+        self._in_progress = set()
+
+    def get_summary(self, conversation_id):
+        """
+        Return the summary as a system message plus its token count, or (None, None).
+        """
+        row = ConversationSummary.query.filter_by(conversation_id=conversation_id).first()
+        if not row:
+            return None, None
+        return self.format_summary_message(row.summary), row.token_count
+
+    @staticmethod
+    def format_summary_message(summary):
+        return {
+            "role": "system",
+            "content": f"Summary of the earlier part of this conversation:\n{summary}"
+        }
+
+    def schedule(self, conversation_id):
+        """
+        Fold older turns into the summary in the background (no-op if already running).
+        """
+        if conversation_id in self._in_progress:
+            return
+        self._in_progress.add(conversation_id)
+
+        def run():
+            try:
+                with self.flask_app.app_context():
+                    while self.summarize(conversation_id):
+                        pass
+            except Exception as e:
+                print(f"[ConversationSummaryCog] Error summarizing conversation {conversation_id}: {e}", flush=True)
+                traceback.print_exc()
+            finally:
+                self._in_progress.discard(conversation_id)
+
+        eventlet.spawn_n(run)
+
+    def summarize(self, conversation_id):
+        """
+        Fold the oldest unsummarized messages into the summary.
+        Returns True if there were more than SUMMARY_MAX_FOLD to fold, so another call has work.
+        """
+        row = ConversationSummary.query.filter_by(conversation_id=conversation_id).first()
+        summarized_through_id = row.summarized_through_id if row else 0
+
+        # The oldest messages not yet folded in. Conversations from before summaries existed
+        # start at 0, so take at most SUMMARY_MAX_FOLD past the kept window per call.
+        limit = SUMMARY_MAX_FOLD + self.keep_recent
+        pending = (
+            Message.query
+            .filter(Message.conversation_id == conversation_id, Message.id > summarized_through_id)
+            .order_by(Message.timestamp, Message.id)
+            .limit(limit + 1)
+            .all()
+        )
+        more = len(pending) > limit
+        to_fold = pending[:limit][:-self.keep_recent]
+        if len(to_fold) < SUMMARY_BATCH:
+            return False
+
+        transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in to_fold)
+        previous_summary = row.summary if row else "(none yet)"
+        response = self.client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You maintain a running summary of a conversation between a user and a USMC AI assistant. "
+                        "Update the summary with the new messages. Keep facts, decisions, names, numbers, "
+                        "file references (FILE:<id>) and open questions; drop pleasantries. "
+                        "Write plain prose of at most 250 words."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
+                }
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0
+        )
+        summary = response.choices[0].message.content.strip()
+        token_count = count_message_tokens(self.format_summary_message(summary))
+
+        if row is None:
+            row = ConversationSummary(conversation_id=conversation_id)
+            db.session.add(row)
+        row.summary = summary
+        row.summarized_through_id = to_fold[-1].id
+        row.token_count = token_count
+        db.session.commit()
+        print(f"[ConversationSummaryCog] Folded {len(to_fold)} message(s) into summary for conversation {conversation_id}", flush=True)
+        return more
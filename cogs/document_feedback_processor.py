@@ -217,7 +217,7 @@ def build_system_and_user_prompt(snippet, feedback, quality_summary):
 
 
 # ----- Main Function -----   # (S)
-def process_stakeholder_feedback(document_path, crm_file_path, model, temperature, openai_client):
+def process_stakeholder_feedback(document_path, crm_file_path, model, temperature, openai_client, progress=None):
     """
     Processes stakeholder feedback for an enterprise document.
     
@@ -231,6 +231,8 @@ def process_stakeholder_feedback(document_path, crm_file_path, model, temperatur
        - For PDFs: it uses page 5 if available; otherwise uses page 1's first 7 lines.
        - For DOCX: it uses the first 7 lines of the global text.
       
+    If `progress` is given, it is called as progress(rows_done, total_rows) after each CRM row.
+
     Returns:
       Markdown-formatted results that include the line (or page/line), feedback, decision, and response.
     """
@@ -286,7 +288,10 @@ def process_stakeholder_feedback(document_path, crm_file_path, model, temperatur
     # Precompile regex for range detection (handles hyphen, en-dash, em-dash)
     range_pattern = re.compile(r'^(\d+)\s*[-–—]\s*(\d+)$')  # Matches "2-6", "2–6", "2—6"
 
-    for idx, row in crm_df.iterrows():
+    total_rows = len(crm_df)
+    for rows_done, (idx, row) in enumerate(crm_df.iterrows()):
+        if progress and rows_done:
+            progress(rows_done, total_rows)
         try:
             feedback = str(row.get("feedback", "")).strip()
             if not feedback:
@@ -454,5 +459,8 @@ def process_stakeholder_feedback(document_path, crm_file_path, model, temperatur
                 f"   **Response:** {error_entry['response']}\n\n"
             )
 
+    if progress:
+        progress(total_rows, total_rows)
+
     # Return markdown results
     return markdown_results
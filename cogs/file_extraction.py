@@ -0,0 +1,187 @@
+# cogs/file_extraction.py
+import os
+import time
+import traceback
+from datetime import datetime
+
+import eventlet
+from cachetools import TTLCache
+from eventlet.event import Event
+from flask import Blueprint, jsonify, request
+
+from db import db
+from models import UploadedFile
+from utils.blob_store import download_blob
+from utils.extracted_text import EXTRACTION_ERRORS, get_extracted_text, get_or_extract_text
+from utils.extraction_pool import extract_text
+from utils.status_emitter import StatusEmitter
+
+FILE_READY_TIMEOUT = float(os.getenv("FILE_READY_TIMEOUT", "60"))  # longest a question waits on one file
+# A 'pending' row this old with no extraction running here is assumed lost (e.g. to a restart) and redone
+FILE_EXTRACTION_STALE_SECONDS = int(os.getenv("FILE_EXTRACTION_STALE_SECONDS", "300"))
+POLL_INTERVAL = 0.5
+
+
+class FileExtractionCog:
+    """
+    Text extraction for uploads, after the upload itself has been answered.
+
+    /chat stores the bytes, adds a 'pending' UploadedFile row to the turn's transaction
+    and hands the stored blob to `submit`. A green thread extracts the text (parsing in a
+    child process, see utils/extraction_pool.py), stores it by content hash, adds it to the
+    retrieval index, marks the committed pending rows for that content 'ready' or 'failed'
+    and emits `file_ready` to their session rooms. Rows committed after that run finished
+    are marked by `settle` once the turn commits. A question about a file waits on that
+    file only (`wait_until_ready`); the status can also be polled at GET /files/<file_id>/status.
+    """
+
+    def __init__(self, flask_app, upload_folder, status_emitter=None, socketio=None,
+                 retrieval_index=None, blob_service_client=None, container_name=None):
+        self.bp = Blueprint("file_extraction_blueprint", __name__)
+        self.flask_app = flask_app
+        self.upload_folder = upload_folder
+        self.status_emitter = status_emitter or StatusEmitter(socketio)
+        self.retrieval_index = retrieval_index
+        self.blob_service_client = blob_service_client
+        self.container_name = container_name
+        self._running = {}  # content_sha256 -> Event sent the final status
+        # content_sha256 -> final status of runs that finished lately, for rows committed after them
+        self._finished = TTLCache(maxsize=1024, ttl=FILE_EXTRACTION_STALE_SECONDS)
+        self.add_routes()
+
+    def add_routes(self):
+        @self.bp.route("/files/<int:file_id>/status", methods=["GET"])
+        def get_file_status(file_id):
+            uploaded_file = db.session.get(UploadedFile, file_id)
+            session_id = request.args.get("session_id")
+            if not uploaded_file or (session_id and uploaded_file.session_id != session_id):
+                return jsonify({"error": "File not found"}), 404
+            return jsonify(self.public_view(uploaded_file, uploaded_file.extraction_status)), 200
+
+    @staticmethod
+    def public_view(uploaded_file, status):
+        return {
+            "fileId": uploaded_file.id,
+            "fileName": uploaded_file.original_filename,
+            "status": status or "ready",
+        }
+
+    def submit(self, content_sha256, stored_name, content_type):
+        """
+        Extract a stored blob's text in the background. Needs no UploadedFile row, so it can start
+        before the turn that uploaded it commits. Content already being extracted in this process
+        just shares that run.
+        """
+        if content_sha256 in self._running:
+            return
+        self._running[content_sha256] = Event()
+        eventlet.spawn_n(self._extract, content_sha256, stored_name, content_type)
+
+    def settle(self, uploaded_files):
+        """
+        Call once a turn's 'pending' uploads are committed: mark the ones whose extraction already
+        finished (its update ran before the rows were committed) and emit their `file_ready`.
+        """
+        finished = {
+            uf.content_sha256 for uf in uploaded_files
+            if uf.extraction_status == "pending"
+            and uf.content_sha256 not in self._running and uf.content_sha256 in self._finished
+        }
+        for content_sha256 in finished:
+            self._emit_ready(self._mark(content_sha256, self._finished[content_sha256]))
+
+    def wait_until_ready(self, uploaded_file, timeout=FILE_READY_TIMEOUT):
+        """
+        Wait up to `timeout` seconds for a pending upload's text and return its extraction status.
+        """
+        if uploaded_file.extraction_status != "pending":
+            return uploaded_file.extraction_status
+        content_sha256 = uploaded_file.content_sha256
+        age = (datetime.utcnow() - uploaded_file.timestamp).total_seconds() if uploaded_file.timestamp else 0
+        if content_sha256 not in self._running and age > FILE_EXTRACTION_STALE_SECONDS:
+            print(f"[FileExtraction] Restarting lost extraction of {uploaded_file.filename}", flush=True)
+            self.submit(content_sha256, uploaded_file.filename, uploaded_file.file_type)
+
+        deadline = time.monotonic() + timeout
+        running = self._running.get(content_sha256)
+        status = None
+        if running is not None:
+            with eventlet.Timeout(timeout, False):
+                status = running.wait()
+        elif content_sha256 in self._finished:
+            status = self._finished[content_sha256]
+        else:
+            # Being extracted by another worker: watch the row and the text
+            while time.monotonic() < deadline:
+                db.session.refresh(uploaded_file)
+                if uploaded_file.extraction_status != "pending" or get_extracted_text(content_sha256) is not None:
+                    break
+                eventlet.sleep(POLL_INTERVAL)
+        db.session.refresh(uploaded_file)
+        if uploaded_file.extraction_status == "pending":
+            if status is not None:
+                # The run finished before this turn's row was committed (`settle` marks it)
+                return status
+            if get_extracted_text(content_sha256) is not None:
+                return "ready"
+        return uploaded_file.extraction_status
+
+    def _extract(self, content_sha256, stored_name, content_type):
+        start = time.monotonic()
+        status = "failed"
+        rows = []
+        running = None
+        try:
+            with self.flask_app.app_context():
+                try:
+                    path, is_temp = self._local_copy(stored_name)
+                    try:
+                        content = get_or_extract_text(content_sha256, lambda: extract_text(path, content_type))
+                    finally:
+                        if is_temp:
+                            os.remove(path)
+                    db.session.commit()
+                    status = "failed" if content in EXTRACTION_ERRORS else "ready"
+                    if status == "ready" and self.retrieval_index is not None:
+                        # Chunked and embedded now, so the first question about it only searches
+                        self.retrieval_index.add(content_sha256, content)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[FileExtraction] Extracting {stored_name} failed: {e}", flush=True)
+                    traceback.print_exc()
+                # From here on a new upload of this content starts its own run, so every row
+                # committed before then is in the update below
+                self._finished[content_sha256] = status
+                running = self._running.pop(content_sha256, None)
+                rows = self._mark(content_sha256, status)
+        finally:
+            if running is None:
+                running = self._running.pop(content_sha256, None)
+            if running is not None:
+                running.send(status)
+        print(f"[FileExtraction] {stored_name} {status} in {time.monotonic() - start:.2f}s", flush=True)
+        self._emit_ready(rows)
+
+    def _emit_ready(self, rows):
+        for session_id, data in rows:
+            self.status_emitter.emit(session_id, "file_ready", data)
+
+    def _local_copy(self, stored_name):
+        # Returns (path, is_temp)
+        path = os.path.join(self.upload_folder, stored_name)
+        if os.path.exists(path) or not self.blob_service_client:
+            return path, False
+        return download_blob(stored_name, self.blob_service_client, self.container_name, self.upload_folder), True
+
+    def _mark(self, content_sha256, status):
+        try:
+            pending = UploadedFile.query.filter_by(content_sha256=content_sha256, extraction_status="pending").all()
+            for uploaded_file in pending:
+                uploaded_file.extraction_status = status
+            db.session.commit()
+            return [(uf.session_id, self.public_view(uf, status)) for uf in pending]
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FileExtraction] Failed to mark uploads of {content_sha256[:12]} {status}: {e}", flush=True)
+            traceback.print_exc()
+            return []
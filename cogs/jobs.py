@@ -0,0 +1,151 @@
+# cogs/jobs.py
+import os
+import time
+import uuid
+import traceback
+from collections import OrderedDict
+
+import eventlet
+from eventlet.queue import LightQueue, Full
+from flask import Blueprint, jsonify, request
+
+from utils.status_emitter import StatusEmitter
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOB_MAX_RETAINED = 1000
+
+
+class JobQueueFull(Exception):
+    """Raised when a job can't be queued because the backlog is at JOB_QUEUE_SIZE."""
+
+
+class JobsCog:
+    """
+    In-process background jobs for long-running chat actions (CRM reviews, image
+    generation, web search, codebase visualization).
+
+    Jobs are queued and run by a fixed number of worker green threads, each in its
+    own app context, so they keep running if the client disconnects. Progress and
+    results are pushed to the session room as `job_update` / `job_complete` /
+    `job_failed` events and can be polled at GET /jobs/<job_id>. `job_update`s go
+    through the StatusEmitter, so a burst of progress reports reaches the client as
+    the latest one.
+    """
+
+    def __init__(self, flask_app, socketio, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, status_emitter=None):
+        self.bp = Blueprint("jobs_blueprint", __name__)
+        self.flask_app = flask_app
+        self.socketio = socketio
+        self.status_emitter = status_emitter or StatusEmitter(socketio)
+        self.workers = workers
+        self.queue = LightQueue(queue_size)
+        self.jobs = OrderedDict()
+        self._worker_pid = None
+        self.add_routes()
+
+    def add_routes(self):
+        @self.bp.route("/jobs/<job_id>", methods=["GET"])
+        def get_job(job_id):
+            job = self.jobs.get(job_id)
+            session_id = request.args.get("session_id")
+            if not job or (session_id and job["session_id"] != session_id):
+                return jsonify({"error": "Job not found"}), 404
+            return jsonify({"job": self.public_view(job)}), 200
+
+    @staticmethod
+    def public_view(job):
+        return {key: value for key, value in job.items() if not key.startswith("_")}
+
+    def _ensure_workers(self):
+        # Started lazily so workers belong to the serving process, not the --preload parent
+        if self._worker_pid == os.getpid():
+            return
+        self._worker_pid = os.getpid()
+        for _ in range(self.workers):
+            eventlet.spawn_n(self._worker)
+
+    def submit(self, session_id, kind, func, /, *args, **kwargs):
+        """
+        Queue `func(job_id, *args, **kwargs)` and return the new job ID right away.
+        The function's return value becomes the job result.
+        """
+        self._ensure_workers()
+        self._prune()
+
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "session_id": session_id,
+            "kind": kind,
+            "status": "queued",
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "_call": (func, args, kwargs),
+        }
+        try:
+            self.queue.put_nowait(job_id)
+        except Full:
+            raise JobQueueFull(f"Job queue is full ({self.queue.maxsize} pending).")
+        self.jobs[job_id] = job
+        self._emit(job, "job_update")
+        print(f"[JobsCog] Queued {kind} job {job_id} for session {session_id}", flush=True)
+        return job_id
+
+    def report_progress(self, job_id, progress):
+        """
+        Record progress for a running job (any JSON-serializable value) and push it to the room.
+        """
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        job["progress"] = progress
+        job["updated_at"] = time.time()
+        self._emit(job, "job_update")
+
+    def _worker(self):
+        while True:
+            job_id = self.queue.get()
+            job = self.jobs.get(job_id)
+            if not job:
+                continue
+            func, args, kwargs = job.pop("_call")
+            job["status"] = "running"
+            job["updated_at"] = time.time()
+            self._emit(job, "job_update")
+            try:
+                with self.flask_app.app_context():
+                    job["result"] = func(job_id, *args, **kwargs)
+                job["status"] = "complete"
+                job["updated_at"] = time.time()
+                self._emit(job, "job_complete")
+            except Exception as e:
+                print(f"[JobsCog] {job['kind']} job {job_id} failed: {e}", flush=True)
+                traceback.print_exc()
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["updated_at"] = time.time()
+                self._emit(job, "job_failed")
+
+    def _emit(self, job, event):
+        try:
+            if event == "job_update":
+                self.status_emitter.update(job["session_id"], event, self.public_view(job), key=job["job_id"])
+            else:
+                self.status_emitter.emit(job["session_id"], event, self.public_view(job))
+        except Exception as e:
+            print(f"[JobsCog] Failed to emit {event} for job {job['job_id']}: {e}", flush=True)
+
+    def _prune(self):
+        # Finished jobs are kept for JOB_RETENTION_SECONDS so reconnecting clients can fetch them
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in list(self.jobs):
+            job = self.jobs[job_id]
+            finished = job["status"] in ("complete", "failed")
+            if finished and (job["updated_at"] < cutoff or len(self.jobs) > JOB_MAX_RETAINED):
+                del self.jobs[job_id]
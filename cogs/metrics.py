@@ -0,0 +1,47 @@
+# cogs/metrics.py
+import os
+import traceback
+
+from flask import Blueprint, jsonify
+from db import get_pool_metrics
+
+
+class MetricsCog:
+    """
+    Read-only operational metrics, for sizing the worker/pool configuration.
+    """
+
+    def __init__(self, history_cache=None, cache_backend=None, status_emitter=None):
+        self.bp = Blueprint("metrics_blueprint", __name__)
+        self.history_cache = history_cache
+        self.cache_backend = cache_backend
+        self.status_emitter = status_emitter
+        self.add_routes()
+
+    def add_routes(self):
+        @self.bp.route("/metrics/db-pool", methods=["GET"])
+        def db_pool_metrics():
+            try:
+                return jsonify({"pid": os.getpid(), "db_pool": get_pool_metrics()}), 200
+            except Exception as e:
+                print(f"[MetricsCog] Failed to collect pool metrics: {e}", flush=True)
+                traceback.print_exc()
+                return jsonify({"error": "Failed to collect pool metrics"}), 500
+
+        @self.bp.route("/metrics/history-cache", methods=["GET"])
+        def history_cache_metrics():
+            if self.history_cache is None:
+                return jsonify({"error": "History cache not configured"}), 404
+            return jsonify({"pid": os.getpid(), "history_cache": self.history_cache.stats()}), 200
+
+        @self.bp.route("/metrics/cache-backend", methods=["GET"])
+        def cache_backend_metrics():
+            if self.cache_backend is None:
+                return jsonify({"error": "Cache backend not configured"}), 404
+            return jsonify({"pid": os.getpid(), "cache_backend": self.cache_backend.stats()}), 200
+
+        @self.bp.route("/metrics/status-emitter", methods=["GET"])
+        def status_emitter_metrics():
+            if self.status_emitter is None:
+                return jsonify({"error": "Status emitter not configured"}), 404
+            return jsonify({"pid": os.getpid(), "status_emitter": self.status_emitter.stats()}), 200
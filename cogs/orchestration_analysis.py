@@ -1,21 +1,256 @@
 # cogs/orchestration_analysis.py
 # from flask import request
 from models import UploadedFile
+from cachetools import TTLCache
+import copy
+import hashlib
 import json
+import os
 import re
+import threading
 import traceback
 
+# ---------------------------------------------------------------------------
+# Rule-based fast path
+# Obvious requests are settled locally; anything ambiguous goes to gpt-4o.
+# ---------------------------------------------------------------------------
+FILE_REF_PATTERN = re.compile(r"FILE:(\d+)")
+VISUALIZE_PATTERN = re.compile(r"\bvisuali[sz](e|es|ed|ing|ation)\b", re.IGNORECASE)
+# "the codebase", "the repo", "code structure", "architecture of the code" (not "org structure")
+CODE_NOUN = r"(?:code\s*base|code|repo(?:sitory)?)"
+CODEBASE_PATTERN = re.compile(
+    rf"\b(?:code\s*base|repo(?:sitory)?)\b"
+    rf"|\b{CODE_NOUN}(?:'s)?\s+(?:architecture|structure)\b"
+    rf"|\b(?:architecture|structure)\s+of\s+(?:the\s+|this\s+|your\s+|my\s+)?{CODE_NOUN}\b",
+    re.IGNORECASE
+)
+RAND_NUM_PATTERN = re.compile(
+    r"\brandom\s+(?:whole\s+)?(?:number|integer|int|num)\b.*?(-?\d+)\s*(?:and|to|-|through)\s*(-?\d+)",
+    re.IGNORECASE | re.DOTALL
+)
+# Words that mean the request needs a tool (search, image, files, code, CRM)
+TOOL_KEYWORD_PATTERN = re.compile(
+    r"\b(search|internet|google|look\s*up|latest|news|current|today|image|picture|photo|draw|"
+    r"file|files|upload|uploaded|document|pdf|code|visuali[sz]e|random|crm|review|wrong)\b",
+    re.IGNORECASE
+)
+CHITCHAT_WORDS = {
+    "hi", "hello", "hey", "hiya", "yo", "howdy", "greetings", "there", "all",
+    "good", "morning", "afternoon", "evening", "night",
+    "thanks", "thank", "you", "thx", "ty", "much", "so", "very",
+    "k", "nice", "awesome",
+    "bye", "goodbye", "later", "see", "ya", "cheers", "sir", "maam", "marine", "devil", "dog",
+    "semper", "fi", "oorah", "rah", "how", "are", "doing", "whats", "up", "sup",
+}
+# Often the answer to an assistant question ("Should I search for that?"), so only settled
+# by rule when the last assistant turn didn't ask one
+ACKNOWLEDGEMENT_WORDS = {"ok", "okay", "cool", "great", "perfect", "got", "it"}
+CHITCHAT_MAX_WORDS = 6
+
+# Decision cache (bounded LRU with a TTL)
+ORCHESTRATION_CACHE_SIZE = int(os.getenv("ORCHESTRATION_CACHE_SIZE", "1024"))
+ORCHESTRATION_CACHE_TTL = int(os.getenv("ORCHESTRATION_CACHE_TTL", "600"))  # seconds
+
+
+def last_assistant_asked(conversation_history):
+    """True when the newest assistant message in the history asks the user a question."""
+    for msg in reversed(conversation_history or []):
+        if msg.get("role") == "assistant":
+            return "?" in (msg.get("content") or "")
+    return False
+
+
+def default_orchestration():
+    """Orchestration with every action switched off."""
+    return {
+        "image_generation": False,
+        "image_prompt": "",
+        "internet_search": False,
+        "file_orchestration": False,
+        "file_ids": [],
+        "active_users": False,
+        "code_orchestration": False,
+        "code_structure_orchestration": False,  # New key
+        "rand_num": [],
+        "crm_review": False
+    }
+
+
+def orchestration_cache_key(user_message, last_five, file_ids):
+    """
+    Hash of the normalized message, the last-5 history window and the session's file IDs.
+    """
+    normalized_message = " ".join((user_message or "").lower().split())
+    payload = json.dumps(
+        {
+            "message": normalized_message,
+            "history": [[msg["role"], msg["content"]] for msg in last_five],
+            "files": sorted(str(fid) for fid in file_ids),
+        },
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 class OrchestrationAnalysisCog:
-    def __init__(self, openai_client):
+    def __init__(self, openai_client, cache_backend=None):
         self.client = openai_client
 
-    def analyze_user_orchestration(self, user_message, conversation_history, session_id):
+        # LLM decisions keyed by orchestration_cache_key, plus the keys each session owns
+        # so they can be dropped when that session uploads a new file.
+        self._cache = TTLCache(maxsize=ORCHESTRATION_CACHE_SIZE, ttl=ORCHESTRATION_CACHE_TTL)
+        self._session_keys = TTLCache(maxsize=ORCHESTRATION_CACHE_SIZE, ttl=ORCHESTRATION_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Optional shared layer behind the local cache, so workers reuse each other's decisions
+        self.cache_backend = cache_backend
+        if cache_backend is not None:
+            cache_backend.subscribe("orchestration", self._on_invalidation)
+
+    @staticmethod
+    def _session_scope(session_id):
+        return f"orchestration:session:{session_id}"
+
+    def get_cached_orchestration(self, cache_key, session_id=None):
+        """
+        Return (orchestration or None, version). On a miss, pass `version` to
+        cache_orchestration so a decision that raced an invalidation isn't shared.
+        """
+        with self._cache_lock:
+            orchestration = self._cache.get(cache_key)
+            if orchestration is not None:
+                self.cache_hits += 1
+                return copy.deepcopy(orchestration), None
+
+        version = None
+        if self.cache_backend is not None:
+            version = self.cache_backend.version(self._session_scope(session_id))
+            orchestration = self.cache_backend.get_versioned(f"orchestration:{cache_key}", version)
+            if orchestration is not None:
+                self._store_local(cache_key, session_id, orchestration)
+                with self._cache_lock:
+                    self.cache_hits += 1
+                return copy.deepcopy(orchestration), version
+
+        with self._cache_lock:
+            self.cache_misses += 1
+        return None, version
+
+    def cache_orchestration(self, cache_key, session_id, orchestration, version=None):
+        self._store_local(cache_key, session_id, orchestration)
+        if self.cache_backend is not None:
+            self.cache_backend.set_versioned(f"orchestration:{cache_key}", orchestration, version,
+                                             ttl=ORCHESTRATION_CACHE_TTL)
+
+    def _store_local(self, cache_key, session_id, orchestration):
+        with self._cache_lock:
+            self._cache[cache_key] = copy.deepcopy(orchestration)
+            keys = self._session_keys.get(session_id) or set()
+            keys.add(cache_key)
+            self._session_keys[session_id] = keys
+
+    def invalidate_session(self, session_id):
+        """
+        Drop every cached decision made for this session (called after a new upload),
+        here and in every other worker.
+        """
+        self._drop_local(session_id)
+        if self.cache_backend is not None:
+            self.cache_backend.bump_version(self._session_scope(session_id), ttl=ORCHESTRATION_CACHE_TTL)
+            self.cache_backend.publish("orchestration", {"session_id": session_id})
+
+    def _on_invalidation(self, message):
+        self._drop_local(message["session_id"])
+
+    def _drop_local(self, session_id):
+        with self._cache_lock:
+            keys = self._session_keys.pop(session_id, None) or set()
+            for key in keys:
+                self._cache.pop(key, None)
+        if keys:
+            print(f'Invalidated {len(keys)} cached orchestration(s) for session {session_id}', flush=True)
+
+    def classify_with_rules(self, user_message, conversation_history=None):
         """
-        Analyze user orchestration using OpenAI and return a JSON object.
+        Settle obvious orchestration cases without calling the LLM.
+        Returns an orchestration dict, or None when the message needs gpt-4o.
+        """
+        message = (user_message or "").strip()
+
+        # No user content: every field is False (same rule the LLM is given)
+        if not message:
+            return default_orchestration()
+
+        keywords = {m.lower() for m in TOOL_KEYWORD_PATTERN.findall(FILE_REF_PATTERN.sub(" ", message))}
+
+        # Explicit FILE:<id> references with nothing else tool-related
+        file_ids = FILE_REF_PATTERN.findall(message)
+        if file_ids:
+            if keywords <= {"file", "files", "document", "pdf", "upload", "uploaded"}:
+                orchestration = default_orchestration()
+                orchestration["file_orchestration"] = True
+                orchestration["file_ids"] = file_ids
+                return orchestration
+            return None
+
+        # "Visualize the code base / code architecture"
+        if VISUALIZE_PATTERN.search(message) and CODEBASE_PATTERN.search(message):
+            if keywords <= {"visualize", "visualise", "code"}:
+                orchestration = default_orchestration()
+                orchestration["code_structure_orchestration"] = True
+                return orchestration
+            return None
+
+        # "Give me a random number between 1 and 10"
+        rand_match = RAND_NUM_PATTERN.search(message)
+        if rand_match:
+            if keywords - {"random"}:
+                return None
+            low, high = sorted(int(n) for n in rand_match.groups())
+            orchestration = default_orchestration()
+            orchestration["rand_num"] = [low, high]
+            return orchestration
+
+        # Greetings, thanks and acknowledgements
+        words = re.findall(r"[a-z]+", message.lower().replace("'", ""))
+        if (
+            not keywords
+            and words
+            and len(words) <= CHITCHAT_MAX_WORDS
+            and all(word in CHITCHAT_WORDS or word in ACKNOWLEDGEMENT_WORDS for word in words)
+        ):
+            if ACKNOWLEDGEMENT_WORDS.intersection(words) and last_assistant_asked(conversation_history):
+                return None
+            return default_orchestration()
+
+        return None
+
+    def analyze_user_orchestration(self, user_message, conversation_history, session_id, uploaded_files=None,
+                                   on_llm_call=None):
+        """
+        Analyze user orchestration and return a JSON object.
+        Obvious cases are decided by `classify_with_rules`, repeats are served from the
+        decision cache, and the rest are sent to OpenAI.
+        The deciding path is recorded under "decided_by" ("rules", "cache" or "llm").
+
+        `uploaded_files` (objects with `id` and `original_filename`) can be passed in when
+        the caller has already listed the session's files; otherwise they are queried here.
+        `on_llm_call` is called just before gpt-4o is asked, i.e. only when neither the rules
+        nor the cache settled the message.
         """
         try:
+            orchestration = self.classify_with_rules(user_message, conversation_history)
+            if orchestration is not None:
+                orchestration["decided_by"] = "rules"
+                print(f'Orchestration decided by rules: {orchestration}', flush=True)
+                return orchestration
+
             # Fetch the list of uploaded files for the current session
-            uploaded_files = UploadedFile.query.filter_by(session_id=session_id).all()
+            if uploaded_files is None:
+                uploaded_files = UploadedFile.query.filter_by(session_id=session_id).all()
             file_list = "\n".join([f"File ID: {file.id}, Filename: {file.original_filename}" for file in uploaded_files])
             if user_message == '':
                 user_message = 'No message included. Probably a file upload.'
@@ -64,6 +299,17 @@ class OrchestrationAnalysisCog:
             # Include the last 5 messages for context, excluding system messages
             user_assistant_messages = [msg for msg in conversation_history if msg['role'] in ['user', 'assistant']]
             last_five = user_assistant_messages[-5:]
+
+            cache_key = orchestration_cache_key(user_message, last_five, [file.id for file in uploaded_files])
+            cached, cache_version = self.get_cached_orchestration(cache_key, session_id)
+            if cached is not None:
+                cached["decided_by"] = "cache"
+                print(f'Orchestration served from cache: {cached}', flush=True)
+                return cached
+
+            if on_llm_call is not None:
+                on_llm_call()
+
             analysis_prompt.extend(last_five)
 
             analysis_prompt.append({"role": "user", "content": user_message})
@@ -93,43 +339,26 @@ class OrchestrationAnalysisCog:
                 print(f'Error in analyzing user orchestration: {e}')
                 traceback.print_exc()
                 # Return default orchestration if analysis fails
-                return {
-                    "image_generation": False,
-                    "image_prompt": "",
-                    "internet_search": False,
-                    "file_orchestration": False,
-                    "file_id": [],
-                    "active_users": False,
-                    "code_orchestration": False,
-                    "code_structure_orchestration": False,  # New key
-                    "rand_num": [],
-                    "crm_review": False
-                }
+                orchestration = default_orchestration()
+                orchestration["decided_by"] = "llm"
+                return orchestration
             # Extract file_ids if file_orchestration is detected
             if orchestration.get("file_orchestration", False):
                 # Find all occurrences of FILE:<id>
-                matches = re.findall(r"FILE:(\d+)", user_message)
+                matches = FILE_REF_PATTERN.findall(user_message)
                 if matches:
                     orchestration["file_ids"] = matches
                 else:
                     # If no specific files are mentioned, return all file IDs
                     orchestration["file_ids"] = [str(file.id) for file in uploaded_files]
 
-
+            orchestration["decided_by"] = "llm"
+            self.cache_orchestration(cache_key, session_id, orchestration, version=cache_version)
             return orchestration
         except Exception as e:
             print(f'Error in analyzing user orchestration: {e}')
             traceback.print_exc()
             # Return default orchestration if analysis fails
-            return {
-                "image_generation": False,
-                "image_prompt": "",
-                "internet_search": False,
-                "file_orchestration": False,
-                "file_id": [],
-                "active_users": False,
-                "code_orchestration": False,
-                "code_structure_orchestration": False,  # New key
-                "rand_num": [],
-                "crm_review": False
-            }
+            orchestration = default_orchestration()
+            orchestration["decided_by"] = "llm"
+            return orchestration
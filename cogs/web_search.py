@@ -1,6 +1,7 @@
 # cogs/web_search.py
 import os
 import json
+import eventlet
 import requests
 import validators
 import pytz
@@ -112,10 +113,16 @@ Examples:
             # Fallback to original query if LLM fails
             return user_input
 
-    def web_search(self, query, history):
-        """Perform a web search using the Google Custom Search API."""
+    def web_search(self, query, history, optimized_query=None):
+        """
+        Perform a web search using the Google Custom Search API.
+
+        `optimized_query` can carry search terms the caller already generated
+        (e.g. speculatively, alongside orchestration); otherwise they are generated here.
+        """
         # First, generate optimized search terms using the LLM
-        optimized_query = self.generate_search_terms(query, history)
+        if not optimized_query:
+            optimized_query = self.generate_search_terms(query, history)
         print(f"Query: {query}\n", flush=True)
         print(f"Optimized Query: {optimized_query}", flush=True)
 
@@ -183,10 +190,14 @@ Examples:
         if not urls:
             return "No valid URLs found in search results."
 
-        contents = []
-        for url in urls:
+        def fetch(url):
             print(f"Fetching content from {url}", flush=True)
-            content = fetch_page_content(url)
+            return url, fetch_page_content(url)
+
+        # Fetch the pages concurrently; imap keeps the search-result order
+        contents = []
+        pool = eventlet.GreenPool(len(urls))
+        for url, content in pool.imap(fetch, urls):
             if content:
                 # Highlight URL clearly for LLM
                 content = f"### Source URL:\n{url}\n\n**Content:**\n{content}\n"
@@ -1,31 +1,147 @@
 # db.py
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from collections import deque
+from eventlet.timeout import Timeout
+import eventlet
 import os
+import time
+import traceback
 
 # Initialize the SQLAlchemy instance without binding it to the app yet
 db = SQLAlchemy()
 
+# INSERT constructs that support ON CONFLICT ... DO NOTHING ... RETURNING
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Pool sizing is per worker process: every gunicorn worker has its own engine, and all
+# of a worker's green threads share it. Total connections = workers * (size + overflow).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Optional server-side budget for this app; split evenly across WEB_CONCURRENCY workers
+DB_MAX_CONNECTIONS = os.getenv("DB_MAX_CONNECTIONS")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+# Background liveness probe (replaces a SELECT 1 before every request)
+DB_HEALTH_INTERVAL = int(os.getenv("DB_HEALTH_INTERVAL", "30"))
+DB_HEALTH_TIMEOUT = int(os.getenv("DB_HEALTH_TIMEOUT", "5"))
+
+
+class PoolMetrics:
+    """
+    Checkout wait times and timeouts for the connection pool, recorded by TimedQueuePool.
+    """
+
+    def __init__(self, window=1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=window)
+
+    def record_wait(self, seconds):
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent_waits.append(seconds)
+
+    def record_timeout(self):
+        self.timeouts += 1
+
+    def snapshot(self):
+        recent = sorted(self.recent_waits)
+
+        def percentile(q):
+            return round(recent[min(int(len(recent) * q), len(recent) - 1)] * 1000, 3) if recent else None
+
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+            "wait_ms_max": round(self.max_wait * 1000, 3),
+            "wait_ms_p50": percentile(0.50),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_p99": percentile(0.99),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits (including opening a new
+    connection when the pool grows) and how often it times out.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def pool_sizes():
+    """
+    Return (pool_size, max_overflow) for this worker.
+    """
+    pool_size, max_overflow = DB_POOL_SIZE, DB_MAX_OVERFLOW
+    if DB_MAX_CONNECTIONS:
+        per_worker = max(int(DB_MAX_CONNECTIONS) // max(WEB_CONCURRENCY, 1), 1)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+    return pool_size, max_overflow
+
+
+def engine_options(uri):
+    """
+    Engine options for `uri`: a sized, timed queue pool, plus TLS and TCP keepalives for PostgreSQL.
+    """
+    if uri.startswith("sqlite") and (":memory:" in uri or uri.rstrip("/").endswith("sqlite:")):
+        # In-memory SQLite lives in a single connection; leave SQLAlchemy's default pool alone
+        return {}
+
+    pool_size, max_overflow = pool_sizes()
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,    # or less, to ensure periodic reconnection
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if uri.startswith("postgresql"):
+        options["connect_args"] = {
+            "sslmode": DB_SSLMODE,
+            "connect_timeout": 60,
+            # Add these for TCP keepalives on some systems:
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 5
+        }
+    return options
+
+
 def init_db(app):
     # Disable track modifications to save resources
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Configure SQLAlchemy Engine Options
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_pre_ping": True,
-    "pool_recycle": 1800,    # or less, to ensure periodic reconnection
-    "pool_size": 10,
-    "max_overflow": 20,
-    "connect_args": {
-        "sslmode": "require",
-        "connect_timeout": 60,
-        # Add these for TCP keepalives on some systems:
-        "keepalives": 1,
-        "keepalives_idle": 30,
-        "keepalives_interval": 10,
-        "keepalives_count": 5
-        }
-    }
 
+    # Configure SQLAlchemy Engine Options
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    print(f"[init_db] Engine options: {app.config['SQLALCHEMY_ENGINE_OPTIONS']}", flush=True)
 
     # Initialize the database with the app
     db.init_app(app)
@@ -36,3 +152,85 @@ def init_db(app):
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         db.session.remove()
+
+
+def get_pool_metrics():
+    """
+    Current pool occupancy plus checkout wait statistics. Call inside an app context.
+    """
+    pool = db.engine.pool
+    metrics = {"pool_class": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "timeout_seconds": pool.timeout(),
+        })
+    metrics.update(pool_metrics.snapshot())
+    return metrics
+
+
+class DBHealthChecker:
+    """
+    Probes the database with SELECT 1 every DB_HEALTH_INTERVAL seconds on a green
+    thread and caches the result, so health checks don't cost a round trip.
+    Broken pooled connections are handled by pool_pre_ping/pool_recycle; this
+    only reports whether the database is reachable at all.
+    """
+
+    def __init__(self, interval=DB_HEALTH_INTERVAL, timeout=DB_HEALTH_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy = None  # Unknown until the first probe finishes
+        self.last_checked = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self._pid = None
+
+    def ensure_started(self, app):
+        # Started lazily so the probe runs in the serving process, not the --preload parent
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        eventlet.spawn_n(self._run, app)
+
+    def _run(self, app):
+        while True:
+            self.check(app)
+            eventlet.sleep(self.interval)
+
+    def check(self, app):
+        try:
+            with app.app_context():
+                try:
+                    with Timeout(self.timeout):
+                        db.session.execute(text("SELECT 1"))
+                finally:
+                    db.session.remove()
+            if self.healthy is False:
+                print(f"[DBHealthChecker] Database reachable again after {self.consecutive_failures} failed probe(s)", flush=True)
+            self.healthy = True
+            self.last_error = None
+            self.consecutive_failures = 0
+        except (Exception, Timeout) as e:
+            self.healthy = False
+            self.last_error = str(e) or type(e).__name__
+            self.consecutive_failures += 1
+            print(f"[DBHealthChecker] Database probe failed ({self.consecutive_failures} in a row): {self.last_error}", flush=True)
+            if self.consecutive_failures == 1:
+                traceback.print_exc()
+        self.last_checked = time.time()
+
+    def status(self):
+        return {
+            "healthy": self.healthy,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+db_health = DBHealthChecker()
@@ -0,0 +1,34 @@
+"""Add composite history indexes, drop message role index
+
+Revision ID: 5d0c7e3f9a21
+Revises: 28860d451a38
+Create Date: 2026-10-17 11:42:08.193562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c7e3f9a21'
+down_revision = '28860d451a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_conversation_id_timestamp_id', ['conversation_id', 'timestamp', 'id'], unique=False)
+        batch_op.drop_index(batch_op.f('ix_message_role'))
+
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.create_index('ix_uploaded_file_session_id_timestamp', ['session_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.drop_index('ix_uploaded_file_session_id_timestamp')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_message_role'), ['role'], unique=False)
+        batch_op.drop_index('ix_message_conversation_id_timestamp_id')
@@ -0,0 +1,36 @@
+"""Add extracted_text table and uploaded_file.content_sha256
+
+Revision ID: 9b4e1f6a2c87
+Revises: 5d0c7e3f9a21
+Create Date: 2026-10-17 14:05:31.482910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e1f6a2c87'
+down_revision = '5d0c7e3f9a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('extracted_text',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_sha256', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_uploaded_file_content_sha256'), ['content_sha256'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_uploaded_file_content_sha256'))
+        batch_op.drop_column('content_sha256')
+
+    op.drop_table('extracted_text')
@@ -0,0 +1,26 @@
+"""Index uploaded_file.filename for content-addressed blob references
+
+Revision ID: c1d7a3e58f42
+Revises: 9b4e1f6a2c87
+Create Date: 2026-10-17 15:20:44.917305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1d7a3e58f42'
+down_revision = '9b4e1f6a2c87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_uploaded_file_filename'), ['filename'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_uploaded_file_filename'))
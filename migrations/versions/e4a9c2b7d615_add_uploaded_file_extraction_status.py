@@ -0,0 +1,26 @@
+"""Add uploaded_file.extraction_status for background text extraction
+
+Revision ID: e4a9c2b7d615
+Revises: c1d7a3e58f42
+Create Date: 2026-10-17 17:05:12.448301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c2b7d615'
+down_revision = 'c1d7a3e58f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extraction_status', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_file', schema=None) as batch_op:
+        batch_op.drop_column('extraction_status')
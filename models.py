@@ -21,6 +21,11 @@ class Message(db.Model):
     """
     Represents a single message in a conversation.
     """
+    __table_args__ = (
+        # History reads filter by conversation and walk (timestamp, id) from either end
+        db.Index('ix_message_conversation_id_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     
     # Foreign key that references the Conversation table
@@ -31,15 +36,22 @@ class Message(db.Model):
         index=True
     )
     
-    role = db.Column(db.String(50), nullable=False, index=True)  # e.g., 'user', 'assistant'
+    role = db.Column(db.String(50), nullable=False)  # e.g., 'user', 'assistant'
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
+    # Tokens in {role, content}, counted once when the message is saved (NULL for older rows)
+    token_count = db.Column(db.Integer, nullable=True)
+
 
 class UploadedFile(db.Model):
     """
     Represents a file uploaded during a conversation.
     """
+    __table_args__ = (
+        db.Index('ix_uploaded_file_session_id_timestamp', 'session_id', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), nullable=False, index=True)  # <--- add this back
     
@@ -51,8 +63,45 @@ class UploadedFile(db.Model):
         index=True
     )
     
-    filename = db.Column(db.String(255), nullable=False)
+    # Stored blob name, `<sha256><ext>` (shared by every upload of the same content)
+    filename = db.Column(db.String(255), nullable=False, index=True)
     original_filename = db.Column(db.String(255), nullable=False)
     file_url = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(100), nullable=False)  # e.g., 'pdf', 'image/png'
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Hex SHA-256 of the file bytes; keys its ExtractedText (NULL for older uploads until first read)
+    content_sha256 = db.Column(db.String(64), nullable=True, index=True)
+    # 'pending' until the text is extracted after upload, then 'ready' or 'failed' (NULL for older uploads)
+    extraction_status = db.Column(db.String(16), nullable=True)
+
+
+class ExtractedText(db.Model):
+    """
+    Text extracted from an uploaded file, stored once per distinct file content.
+    """
+    sha256 = db.Column(db.String(64), primary_key=True)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ConversationSummary(db.Model):
+    """
+    Rolling summary of the older turns of a conversation, so prompts can send
+    the summary plus the recent messages instead of the full history.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+
+    conversation_id = db.Column(
+        db.Integer,
+        db.ForeignKey('conversation.id'),
+        nullable=False,
+        unique=True,
+        index=True
+    )
+
+    summary = db.Column(db.Text, nullable=False)
+    # Newest Message.id folded into the summary
+    summarized_through_id = db.Column(db.Integer, nullable=False, default=0)
+    # Tokens in the summary as it is sent to the model
+    token_count = db.Column(db.Integer, nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
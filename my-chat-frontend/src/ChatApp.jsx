@@ -380,6 +380,28 @@ function ChatApp() {
   const conversationRef = useRef(null);
   const fileInputRef = useRef(null);
   const socketRef = useRef(null);
+  // Id of the assistant placeholder currently receiving streamed tokens
+  const streamingIdRef = useRef(null);
+  // Background jobs: job_id -> placeholder id, and results that arrived before the HTTP reply
+  const pendingJobsRef = useRef({});
+  const finishedJobsRef = useRef({});
+
+  // Fill a background job's placeholder, or hold the result until /chat returns its job_id
+  const finishJob = (job) => {
+    const targetId = pendingJobsRef.current[job.job_id];
+    if (!targetId) {
+      finishedJobsRef.current[job.job_id] = job;
+      return;
+    }
+    delete pendingJobsRef.current[job.job_id];
+    const content =
+      job.status === "complete"
+        ? (job.result && job.result.assistant_reply) || ""
+        : `Error: ${job.error || "Background task failed."}`;
+    setConversation((prev) =>
+      prev.map((m) => (m.id === targetId ? { ...m, content, loading: false } : m))
+    );
+  };
 
   // Initialize WebSocket
   useEffect(() => {
@@ -403,10 +425,37 @@ function ChatApp() {
         setError("WebSocket connection failed. Please refresh the page.");
       });
 
+      socketRef.current.on("token_delta", (data) => {
+        const targetId = streamingIdRef.current;
+        if (!targetId || !data || !data.delta) return;
+        setConversation((prev) =>
+          prev.map((m) =>
+            m.id === targetId
+              ? {
+                  ...m,
+                  content: (m.streamed ? m.content : "") + data.delta,
+                  streamed: true,
+                  loading: false,
+                }
+              : m
+          )
+        );
+      });
+
       socketRef.current.on("task_complete", () => {
         setStatusMessage("");
       });
 
+      socketRef.current.on("job_complete", finishJob);
+      socketRef.current.on("job_failed", finishJob);
+
+      // Text extraction of an upload finished in the background
+      socketRef.current.on("file_ready", (data) => {
+        if (data && data.status === "failed") {
+          setError(`Couldn't read the contents of ${data.fileName}.`);
+        }
+      });
+
       socketRef.current.io.on("reconnect_attempt", () => {
         console.log("Attempting to reconnect...");
       });
@@ -641,6 +690,7 @@ function ChatApp() {
       })) : [],
     };
     const placeholderId = userMessage.id + 1;
+    streamingIdRef.current = placeholderId;
   
     // Insert the user message and a placeholder for the assistant response
     setConversation((prev) => {
@@ -671,6 +721,8 @@ function ChatApp() {
       payload.append("system_prompt", systemPrompt.trim());
       payload.append("temperature", temperature);
       payload.append("room", storedSessionId);
+      payload.append("stream", "true");
+      payload.append("background", "true");
       // Append each file individually
       selectedFile.forEach((file) => {
         payload.append("files", file); // "files" will now be an array of files on the server side
@@ -683,6 +735,8 @@ function ChatApp() {
         system_prompt: systemPrompt.trim(),
         temperature,
         room: storedSessionId,
+        stream: true,
+        background: true,
       };
       fetchOptions = {
         method: "POST",
@@ -699,6 +753,18 @@ function ChatApp() {
         throw new Error(errData.error || "Failed to fetch.");
       }
       const data = await res.json();
+
+      // Long-running actions come back as a job; the result arrives over the socket
+      if (res.status === 202 && data.job_id) {
+        pendingJobsRef.current[data.job_id] = placeholderId;
+        const early = finishedJobsRef.current[data.job_id];
+        if (early) {
+          delete finishedJobsRef.current[data.job_id];
+          finishJob(early);
+        }
+        return;
+      }
+
       const { assistant_reply, intent = {} } = data;
   
       if (data.error) {
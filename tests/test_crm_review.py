@@ -0,0 +1,53 @@
+# tests/test_crm_review.py
+import io
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+import cogs.chat as chat
+from db import db
+from models import Conversation
+from utils.file_utils import process_uploaded_file
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def upload(tmp_path, conversation_id, name, data, content_type):
+    file = FileStorage(stream=io.BytesIO(data), filename=name, content_type=content_type)
+    _, _, _, uploaded_file = process_uploaded_file(
+        file=file, upload_folder=str(tmp_path), session_id='s1',
+        conversation_id=conversation_id, extract=False
+    )
+    return uploaded_file
+
+
+def test_crm_file_found_by_original_filename(app, tmp_path, monkeypatch):
+    conversation = Conversation(session_id='s1', title='CRM')
+    db.session.add(conversation)
+    db.session.commit()
+    document = upload(tmp_path, conversation.id, 'report.pdf', b'%PDF-1.4 report', 'application/pdf')
+    crm = upload(tmp_path, conversation.id, 'crm_export.xlsx', b'crm rows', XLSX_TYPE)
+    # Stored under the content hash, so only the original name says which file is the CRM
+    assert 'crm' not in crm.filename
+
+    calls = []
+    monkeypatch.setattr(chat, 'process_stakeholder_feedback',
+                        lambda document_path, crm_file_path, **kwargs: calls.append((document_path, crm_file_path)) or 'done')
+    cog = SimpleNamespace(serialize_files=lambda files: None)
+
+    payload, status = chat.ChatCog.handle_crm(cog, [document, crm], 'Conduct a CRM review', [], {})
+
+    assert status == 200
+    assert calls == [(document.file_url, crm.file_url)]
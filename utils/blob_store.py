@@ -0,0 +1,113 @@
+# utils/blob_store.py
+"""
+Content-addressed storage for uploaded files.
+
+Each distinct file is stored once, named `<sha256><ext>`, in the local uploads
+folder or as an Azure blob. Every upload still gets its own UploadedFile row, whose
+`filename` is the shared blob name, so a duplicate upload costs one DB row. The rows
+naming a blob are its reference count. Nothing deletes uploads, so blobs are never
+removed. Writing the same content twice is harmless, so concurrent uploads of a new
+file need no locking.
+
+Uploads are ingested in one pass over the request stream, `UPLOAD_CHUNK_SIZE` bytes
+at a time: each chunk is hashed and written to a spool file next to the uploads.
+The name is only known once the whole file is hashed, so the spool is then renamed
+into place (local) or sent to Azure block by block, and text is extracted from it.
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from models import UploadedFile
+
+try:
+    from azure.storage.blob import BlobBlock, ContentSettings
+except ImportError:
+    BlobBlock = ContentSettings = None
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+AZURE_BLOCK_SIZE = int(os.getenv("AZURE_BLOCK_SIZE", str(4 * 1024 * 1024)))
+
+
+def blob_name(sha256, filename):
+    # Keep the extension so served files get the right Content-Type
+    ext = os.path.splitext(secure_filename(filename or ""))[1].lower()[:16]
+    return f"{sha256}{ext}"
+
+
+def blob_ref_count(name):
+    return UploadedFile.query.filter_by(filename=name).count()
+
+
+def spool_upload(file, spool_dir=None):
+    """
+    Copy an uploaded FileStorage's stream to a temp file, hashing it on the way.
+    Returns (spool_path, sha256, size); the caller removes the spool file.
+    """
+    spool_dir = spool_dir or tempfile.gettempdir()
+    spool_path = os.path.join(spool_dir, f".incoming-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(spool_path, "wb") as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+        raise
+    return spool_path, digest.hexdigest(), size
+
+
+def store_local_blob(spool_path, sha256, filename, upload_folder):
+    """
+    Move a spooled upload to its content address unless it's already stored. Returns (name, path, is_new).
+    """
+    name = blob_name(sha256, filename)
+    path = os.path.join(upload_folder, name)
+    is_new = not os.path.exists(path)
+    if is_new:
+        os.replace(spool_path, path)
+    return name, path, is_new
+
+
+def store_azure_blob(spool_path, sha256, filename, content_type, blob_service_client, container_name):
+    """
+    Upload a spooled file as its content-addressed blob, in AZURE_BLOCK_SIZE blocks, unless an
+    upload already refers to that blob. Returns (name, url, is_new).
+    """
+    name = blob_name(sha256, filename)
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=name)
+    is_new = blob_ref_count(name) == 0
+    if is_new:
+        block_list = []
+        with open(spool_path, "rb") as f:
+            for index, chunk in enumerate(iter(lambda: f.read(AZURE_BLOCK_SIZE), b"")):
+                block_id = base64.b64encode(f"{index:08d}".encode()).decode()
+                blob_client.stage_block(block_id=block_id, data=chunk)
+                block_list.append(BlobBlock(block_id=block_id))
+        blob_client.commit_block_list(block_list, content_settings=ContentSettings(content_type=content_type))
+    return name, blob_client.url, is_new
+
+
+def download_blob(name, blob_service_client, container_name, dest_dir=None):
+    """
+    Copy a stored blob to a temp file (the caller removes it) and return its path.
+    """
+    dest_dir = dest_dir or tempfile.gettempdir()
+    path = os.path.join(dest_dir, f".download-{uuid.uuid4().hex}{os.path.splitext(name)[1]}")
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=name)
+    try:
+        with open(path, "wb") as out:
+            blob_client.download_blob().readinto(out)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
@@ -0,0 +1,291 @@
+# utils/cache_backend.py
+"""
+Shared cache layer for state that must agree across gunicorn workers.
+
+Values are JSON-serialized and stored under string keys with an optional TTL.
+`CACHE_URL` selects the backend:
+
+    memory://                 in-process dict (default; fine for a single worker)
+    fakeredis://              in-process Redis emulation (offline tests of the Redis path)
+    redis://host:6379/0       Redis, shared by every worker and container
+
+Per-process (L1) caches stay in front of it for speed. When one worker changes
+or drops shared state it publishes an invalidation on a channel, and every
+other worker's subscriber drops its own L1 copy.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+import weakref
+from collections import OrderedDict
+
+import eventlet
+
+CACHE_URL = os.getenv("CACHE_URL", os.getenv("REDIS_URL", "memory://"))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "mcchat:")
+INVALIDATION_POLL_SECONDS = 1.0
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class CacheBackend:
+    """
+    get/set/delete with TTLs, plus publish/subscribe for invalidation messages.
+    Subclasses implement the _raw_* methods; keys are namespaced with CACHE_KEY_PREFIX.
+    """
+
+    def __init__(self, prefix=CACHE_KEY_PREFIX):
+        self.prefix = prefix
+        self._handlers = {}
+        self._origin = None
+        self._listener_pid = None
+
+    # --- key/value ---------------------------------------------------------
+    def get(self, key, default=None):
+        try:
+            raw = self._raw_get(self.prefix + key)
+        except Exception as e:
+            print(f"[CacheBackend] get {key} failed: {e}", flush=True)
+            return default
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        try:
+            self._raw_set(self.prefix + key, json.dumps(value), ttl)
+        except Exception as e:
+            print(f"[CacheBackend] set {key} failed: {e}", flush=True)
+
+    # --- versioned entries ------------------------------------------------
+    # A scope's version is a random token replaced on every write to the scope. Entries are
+    # tagged with the version that was current *before* their data was read, so a fill
+    # that raced a write (in any worker) is never served. The version outlives entries
+    # (2 * ttl), so an untagged entry can't become current again when it expires.
+    def version(self, scope):
+        return self.get(f"{scope}:version")
+
+    def bump_version(self, scope, ttl=None):
+        self.set(f"{scope}:version", uuid.uuid4().hex, ttl=2 * ttl if ttl else None)
+
+    def get_versioned(self, key, version):
+        entry = self.get(key)
+        if entry is None or entry.get("version") != version:
+            return None
+        return entry["value"]
+
+    def set_versioned(self, key, value, version, ttl=None):
+        self.set(key, {"version": version, "value": value}, ttl=ttl)
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self._raw_delete(*[self.prefix + key for key in keys])
+        except Exception as e:
+            print(f"[CacheBackend] delete {keys} failed: {e}", flush=True)
+
+    # --- invalidation messages --------------------------------------------
+    @property
+    def origin(self):
+        # Unique per process (regenerated after fork) so workers ignore their own messages
+        if self._origin is None or self._origin[0] != os.getpid():
+            self._origin = (os.getpid(), uuid.uuid4().hex)
+        return self._origin[1]
+
+    def subscribe(self, channel, handler):
+        """
+        Call `handler(message)` for every message another process publishes on `channel`.
+        """
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel, message):
+        try:
+            self._raw_publish(self.prefix + channel, json.dumps({"origin": self.origin, "message": message}))
+        except Exception as e:
+            print(f"[CacheBackend] publish on {channel} failed: {e}", flush=True)
+
+    def ensure_listening(self):
+        """
+        Start this process's subscriber green thread (no-op if already running here).
+        Started lazily so it runs in the serving worker, not the --preload parent.
+        """
+        if self._listener_pid == os.getpid() or not self._handlers:
+            return
+        self._listener_pid = os.getpid()
+        eventlet.spawn_n(self._listen)
+
+    def _dispatch(self, channel, payload):
+        data = json.loads(payload)
+        if data.get("origin") == self.origin:
+            return
+        for handler in self._handlers.get(channel[len(self.prefix):], []):
+            try:
+                handler(data.get("message"))
+            except Exception as e:
+                print(f"[CacheBackend] Invalidation handler for {channel} failed: {e}", flush=True)
+                traceback.print_exc()
+
+    def _listen(self):
+        # Receive messages and pass them to _dispatch. Backends that deliver them synchronously
+        # from _raw_publish (InMemoryBackend) have nothing to listen for.
+        return
+
+    def stats(self):
+        return {"backend": type(self).__name__, "channels": sorted(self._handlers)}
+
+
+class InMemoryBackend(CacheBackend):
+    """
+    Process-local LRU store with per-key expiry, capped at `max_bytes` of serialized
+    values. Messages are delivered to other InMemoryBackend instances in this
+    process, which is all a single worker needs.
+    """
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, prefix=CACHE_KEY_PREFIX, max_bytes=MEMORY_CACHE_MAX_BYTES):
+        super().__init__(prefix)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        InMemoryBackend._instances.add(self)
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+        return entry
+
+    def _raw_get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def _raw_set(self, key, raw, ttl):
+        with self._lock:
+            self._pop(key)
+            if len(raw) > self.max_bytes:
+                return
+            self._data[key] = (raw, time.time() + ttl if ttl else None)
+            self.bytes += len(raw)
+            while self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _raw_delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._pop(key)
+
+    def _raw_publish(self, channel, payload):
+        for backend in list(InMemoryBackend._instances):
+            if backend is not self:
+                backend._dispatch(channel, payload)
+
+    def ensure_listening(self):
+        # Delivery is synchronous in _raw_publish; nothing to run
+        return
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"keys": len(self._data), "bytes": self.bytes, "max_bytes": self.max_bytes})
+        return stats
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis (or fakeredis) backed store; invalidations travel over Redis pub/sub.
+    """
+
+    def __init__(self, client, prefix=CACHE_KEY_PREFIX):
+        super().__init__(prefix)
+        self.client = client
+
+    def _raw_get(self, key):
+        return self.client.get(key)
+
+    def _raw_set(self, key, raw, ttl):
+        self.client.set(key, raw, ex=ttl)
+
+    def _raw_delete(self, *keys):
+        self.client.delete(*keys)
+
+    def _raw_publish(self, channel, payload):
+        self.client.publish(channel, payload)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*[self.prefix + channel for channel in self._handlers])
+                while True:
+                    message = pubsub.get_message(timeout=INVALIDATION_POLL_SECONDS)
+                    if message and message.get("type") == "message":
+                        channel = message["channel"]
+                        data = message["data"]
+                        self._dispatch(
+                            channel.decode() if isinstance(channel, bytes) else channel,
+                            data.decode() if isinstance(data, bytes) else data
+                        )
+                    eventlet.sleep(0)
+            except Exception as e:
+                print(f"[RedisBackend] Invalidation listener error, reconnecting: {e}", flush=True)
+                eventlet.sleep(INVALIDATION_POLL_SECONDS)
+
+    def stats(self):
+        stats = super().stats()
+        try:
+            stats["used_memory"] = self.client.info("memory").get("used_memory_human")
+        except Exception:
+            pass
+        return stats
+
+
+_fake_server = None
+
+
+def redis_client_from_url(url):
+    """
+    Redis client for a redis://, rediss:// or unix:// URL, or a fakeredis client for fakeredis://.
+    """
+    global _fake_server
+    if url.startswith("fakeredis://"):
+        import fakeredis
+        # One server per process, so every client created here sees the same data and channels
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        return fakeredis.FakeStrictRedis(server=_fake_server)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return redis.Redis.from_url(url, socket_timeout=5, health_check_interval=30)
+    raise ValueError(f"Unsupported Redis URL: {url}")
+
+
+def create_cache_backend(url=CACHE_URL):
+    """
+    Build the backend named by `url` (see the module docstring).
+    """
+    if url.startswith("memory://"):
+        return InMemoryBackend()
+    return RedisBackend(redis_client_from_url(url))
+
+
+_backend = None
+
+
+def get_cache_backend():
+    """
+    The process-wide backend for CACHE_URL, created on first use.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_cache_backend()
+        print(f"[cache_backend] Using {type(_backend).__name__} for {CACHE_URL.split('@')[-1]}", flush=True)
+    return _backend
@@ -0,0 +1,63 @@
+# utils/extracted_text.py
+"""
+Extracted file text stored once per SHA-256 of the file's bytes (the ExtractedText table).
+
+Text is written when a file is uploaded and read back for every later question
+about it, so a file is parsed at most once however often it's asked about or
+re-uploaded.
+"""
+import hashlib
+
+from db import db, UPSERT_INSERTS
+from models import ExtractedText
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# What the extractors in text_extraction return on failure; never stored, so a later read retries
+EXTRACTION_ERRORS = frozenset({
+    "Error processing file.",
+    "Error processing PDF file.",
+    "Error processing Word file.",
+    "Error processing Excel file.",
+})
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_extracted_text(sha256):
+    row = db.session.get(ExtractedText, sha256)
+    return row.content if row is not None else None
+
+
+def store_extracted_text(sha256, content):
+    """
+    Add the text for `sha256` to the current transaction (the caller commits).
+    Concurrent uploads of the same content are fine: the first insert wins.
+    """
+    upsert_insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if upsert_insert is not None:
+        db.session.execute(
+            upsert_insert(ExtractedText)
+            .values(sha256=sha256, content=content)
+            .on_conflict_do_nothing(index_elements=[ExtractedText.sha256])
+        )
+    else:
+        db.session.merge(ExtractedText(sha256=sha256, content=content))
+
+
+def get_or_extract_text(sha256, extract):
+    """
+    Stored text for `sha256`, or `extract()`'s result, which is stored unless it is an extraction error.
+    """
+    content = get_extracted_text(sha256)
+    if content is None:
+        content = extract()
+        if content not in EXTRACTION_ERRORS:
+            store_extracted_text(sha256, content)
+    return content
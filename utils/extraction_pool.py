@@ -0,0 +1,171 @@
+# utils/extraction_pool.py
+"""
+Document parsing off the eventlet hub.
+
+PDF, Word and Excel parsing is CPU-bound pure Python; run in the web worker it
+stalls every other socket and request until it finishes. `extract_text` runs
+it in a child process instead (`python -m utils.text_extraction`, see that
+module) and waits on the pipe cooperatively, so the hub keeps serving.
+
+- At most EXTRACTION_WORKERS children run at once per web worker; further jobs wait
+  for a slot.
+- Each child has EXTRACTION_TIMEOUT seconds and an EXTRACTION_MAX_MEMORY_MB address
+  space limit. Past either it's killed and the usual "Error processing ..." text is
+  returned (never stored, so a later read retries).
+- PDFs of PDF_SPLIT_MIN_BYTES or more are split into up to EXTRACTION_WORKERS page
+  ranges (of at least PDF_PAGES_PER_JOB pages) parsed in parallel, each stopping once
+  it has WORD_LIMIT words.
+- Plain text, and documents under EXTRACTION_INLINE_BYTES, are cheaper to read
+  in-process than to start a child for.
+"""
+import json
+import os
+import sys
+import time
+
+import eventlet
+from eventlet.green import subprocess
+from eventlet.semaphore import Semaphore
+
+from utils.text_extraction import (
+    EXCEL_TYPES, PDF_TYPES, WORD_LIMIT, WORD_TYPES,
+    error_text, extract_text_from_path, truncate_content
+)
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "120"))  # seconds per child process
+EXTRACTION_MAX_MEMORY_MB = int(os.getenv("EXTRACTION_MAX_MEMORY_MB", "1024"))  # 0 for no limit
+EXTRACTION_INLINE_BYTES = int(os.getenv("EXTRACTION_INLINE_BYTES", str(128 * 1024)))
+PDF_SPLIT_MIN_BYTES = int(os.getenv("PDF_SPLIT_MIN_BYTES", str(2 * 1024 * 1024)))
+PDF_PAGES_PER_JOB = int(os.getenv("PDF_PAGES_PER_JOB", "50"))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCUMENT_TYPES = PDF_TYPES | WORD_TYPES | EXCEL_TYPES
+
+_slots = Semaphore(max(1, EXTRACTION_WORKERS))
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def extract_text(path, content_type):
+    """
+    Text of the file at `path`, as `extract_text_from_path` would return it, parsed in a child process.
+    """
+    if content_type not in DOCUMENT_TYPES or _size(path) < EXTRACTION_INLINE_BYTES:
+        return extract_text_from_path(path, content_type)
+    start = time.monotonic()
+    try:
+        if content_type in PDF_TYPES and _size(path) >= PDF_SPLIT_MIN_BYTES:
+            content = _extract_pdf_split(path)
+        else:
+            content = _run_worker("text", path, content_type)["text"]
+    except ExtractionError as e:
+        print(f"[extraction] {os.path.basename(path)}: {e}", flush=True)
+        return error_text(content_type)
+    print(f"[extraction] {os.path.basename(path)} parsed in {time.monotonic() - start:.2f}s", flush=True)
+    return content
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _extract_pdf_split(path):
+    pages = _run_worker("pdf-count", path)["count"]
+    jobs = min(EXTRACTION_WORKERS, pages // PDF_PAGES_PER_JOB)
+    if jobs <= 1:
+        return _run_worker("text", path, "application/pdf")["text"]
+    per_job = -(-pages // jobs)
+    ranges = [(start, min(start + per_job, pages)) for start in range(0, pages, per_job)]
+
+    group = _JobGroup()
+    pool = eventlet.GreenPool(len(ranges))
+    threads = [pool.spawn(_run_worker, "pdf-pages", path, start, end, group=group) for start, end in ranges]
+    texts = []
+    try:
+        for thread in threads:
+            texts.append(thread.wait()["text"])
+            if len("".join(texts).split()) > WORD_LIMIT:
+                # The leading pages already fill the limit; the rest would be truncated away
+                break
+    finally:
+        group.cancel()
+        for thread in threads:
+            try:
+                thread.wait()
+            except ExtractionError:
+                pass
+    return truncate_content("".join(texts))
+
+
+class _JobGroup:
+    """
+    Child processes working on one file, so the rest can be stopped once they're not needed.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.procs = set()
+
+    def cancel(self):
+        self.cancelled = True
+        for proc in self.procs:
+            proc.kill()
+
+
+def _limit_memory():
+    # Runs in the child before exec
+    limit = EXTRACTION_MAX_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run_worker(op, path, *args, group=None):
+    """
+    Run one `utils.text_extraction` job in a child process and return its JSON result.
+    """
+    with _slots:
+        if group is not None and group.cancelled:
+            raise ExtractionError(f"{op} cancelled")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "utils.text_extraction", op, path, *map(str, args)],
+            cwd=PROJECT_ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=_limit_memory if resource is not None and EXTRACTION_MAX_MEMORY_MB > 0 else None
+        )
+        if group is not None:
+            group.procs.add(proc)
+        try:
+            with eventlet.Timeout(EXTRACTION_TIMEOUT):
+                out, err = proc.communicate()
+        except eventlet.Timeout:
+            proc.kill()
+            proc.wait()
+            raise ExtractionError(f"{op} timed out after {EXTRACTION_TIMEOUT:g}s")
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            if group is not None:
+                group.procs.discard(proc)
+    if err:
+        print(err.decode(errors="replace").rstrip(), flush=True)
+    try:
+        result = json.loads(out)
+    except ValueError:
+        # Killed (e.g. MemoryError past the address space limit) before it wrote a result
+        raise ExtractionError(f"{op} exited with status {proc.returncode}")
+    if "error" in result:
+        raise ExtractionError(f"{op} failed: {result['error']}")
+    return result
@@ -1,6 +1,4 @@
 import os
-import io
-import uuid
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import traceback
@@ -8,11 +6,10 @@ import traceback
 # Existing imports
 from db import db
 from models import UploadedFile
-
-# Document parsers
-from docx import Document
-from openpyxl import load_workbook
-from PyPDF2 import PdfReader
+from utils.extracted_text import EXTRACTION_ERRORS, get_extracted_text, get_or_extract_text
+from utils.blob_store import spool_upload, store_local_blob, store_azure_blob
+from utils.extraction_pool import extract_text
+from utils.text_extraction import content_type_for_path
 
 # Optional Azure imports
 try:
@@ -21,8 +18,6 @@ except ImportError:
     # If azure.storage.blob is not installed, handle gracefully
     BlobServiceClient = None
 
-WORD_LIMIT = 50000
-
 def process_uploaded_file(
     file=None,
     upload_folder=None,
@@ -33,7 +28,9 @@ def process_uploaded_file(
     use_azure=False,
     blob_service_client=None,
     container_name=None,
-    conversation_id=None
+    conversation_id=None,
+    commit=True,
+    extract=True
 ):
     """
     Handles file saving and processing.
@@ -51,6 +48,15 @@ def process_uploaded_file(
     :param use_azure: Whether to upload to Azure instead of saving locally.
     :param blob_service_client: An instance of BlobServiceClient (if use_azure=True).
     :param container_name: The name of the Azure container (if use_azure=True).
+    :param commit: If False, only flush the UploadedFile row (so it has an ID) and leave
+                   the commit to the caller, e.g. together with the turn's messages.
+    :param extract: If False, don't parse the file here: content seen before gets its stored
+                    text, anything else comes back as None with extraction_status 'pending'
+                    for the caller to extract in the background (cogs/file_extraction.py).
+
+    Files are stored under their SHA-256 (see utils/blob_store.py) and so is their
+    extracted text (utils/extracted_text.py): content that was uploaded before is
+    neither stored nor parsed again, only given a new UploadedFile row.
     :return: Tuple (file_content, file_url, file_type, uploaded_file)
     """
 
@@ -69,127 +75,83 @@ def process_uploaded_file(
     print('Not returning, continuing to process files.', flush=True)
     # Generate secure filename
     filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-
-    # --------------------------
-    # A) Upload to Azure Storage
-    # --------------------------
-    if use_azure and blob_service_client and container_name:
-        # Read file content into memory
-        file_bytes = file.read()
-
-        # Attempt uploading to Azure
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=unique_filename
-        )
-        try:
-            blob_client.upload_blob(file_bytes, overwrite=True)
-            azure_blob_url = blob_client.url
-            file_url = azure_blob_url
-        except Exception as e:
-            print("Error uploading to Azure Blob Storage:", e)
-            return "Error uploading file.", None, None, None
-        try:
-            # Insert a record in the database with the Azure file info
-            uploaded_file = UploadedFile(
-                session_id=session_id,
-                filename=unique_filename,
-                original_filename=filename,
-                file_url=file_url,
-                file_type=file.content_type,
-                conversation_id=conversation_id
-            )
-            db.session.add(uploaded_file)
-            db.session.commit()
-        except Exception as e:
-            # Rollback the session to avoid leaving it in a broken state
-            db.session.rollback()
-            print(f"Error while saving uploaded file record to the database: {e}", flush=True)
-            traceback.print_exc()
-            # Optionally, re-raise the exception to propagate it
-            raise e
-            
 
+    # One read of the request stream: hashed and spooled to disk in chunks
+    spool_path, content_sha256, file_size = spool_upload(file, upload_folder)
+    print(f"Spooled {file_size} bytes for {filename} (sha256 {content_sha256[:12]})", flush=True)
+    try:
+        # --------------------------
+        # A) Upload to Azure Storage
+        # --------------------------
+        if use_azure and blob_service_client and container_name:
+            # Block upload from the spool (skipped if this content is already stored)
+            try:
+                stored_name, file_url, is_new = store_azure_blob(
+                    spool_path, content_sha256, filename, file.content_type,
+                    blob_service_client, container_name
+                )
+                print(f"{'Uploaded' if is_new else 'Reusing'} blob {stored_name}", flush=True)
+            except Exception as e:
+                print("Error uploading to Azure Blob Storage:", e)
+                return "Error uploading file.", None, None, None
+            file_path = spool_path
 
-        # Extract the text for indexing/LLM usage
-        file_content = extract_content_from_memory(
-            file_bytes=file_bytes,
-            content_type=file.content_type
-        )
-        file_type = file.content_type
-
-    # -------------------------
-    # B) Store File Locally
-    # -------------------------
-    else:
-        # Construct local file path and save the file
-        file_path = os.path.join(upload_folder, unique_filename)
-        file.save(file_path)
-        print(flush=True)
-
-        # Log file save details
-        try:
-            file_size = os.path.getsize(file_path)
-            print(f"Saved file at {file_path}, size: {file_size} bytes", flush=True)
-        except Exception as e:
-            print(f"Error accessing saved file: {e}", flush=True)
-            return "Error accessing saved file.", None, None, None
-
+        # -------------------------
+        # B) Store File Locally
+        # -------------------------
+        else:
+            # Move the spool to its content address (kept as-is if it's already there)
+            stored_name, file_path, is_new = store_local_blob(spool_path, content_sha256, filename, upload_folder)
+            print(f"{'Stored new' if is_new else 'Reusing stored'} file {stored_name}", flush=True)
+            # Local URL for the stored file
+            file_url = f"/uploads/{stored_name}"
 
         print(f'In process files util: {session_id}', flush=True)
         print(f'In process files util. file_path: {file_path}', flush=True)
 
-        print(flush=True)
-
-        # Insert record in DB with local file path
-        try:
-            uploaded_file = UploadedFile(
-                session_id=session_id,
-                filename=unique_filename,
-                original_filename=filename,
-                file_url=f"/uploads/{unique_filename}",
-                file_type=file.content_type,
-                conversation_id=conversation_id
+        # Extract the text for indexing/LLM usage from the file on disk (or reuse it, for content seen before);
+        # documents are parsed in a child process so the hub keeps serving (utils/extraction_pool.py)
+        if extract:
+            file_content = get_or_extract_text(
+                content_sha256, lambda: extract_text(file_path, file.content_type)
             )
-            print(f'Adding to db: {uploaded_file}', flush=True)
-            db.session.add(uploaded_file)
-            db.session.commit()
-        except Exception as e:
-            # Rollback the session to avoid leaving it in a broken state
-            db.session.rollback()
-            print(f"Error while saving uploaded file record to the database: {e}", flush=True)
-            traceback.print_exc()
-            # Optionally, re-raise the exception to propagate it
-            raise e
+            extraction_status = "failed" if file_content in EXTRACTION_ERRORS else "ready"
+        else:
+            file_content = get_extracted_text(content_sha256)
+            extraction_status = "pending" if file_content is None else "ready"
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
 
-        print(f'Added to db: {uploaded_file}', flush=True)
+    file_type = file.content_type
 
-        # Extract text from local file
-        if file.content_type == 'application/pdf':
-            file_content = extract_text_from_pdf(file_path)
-        elif file.content_type in [
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/msword'
-        ]:
-            file_content = extract_text_from_docx(file_path)
-        elif file.content_type in [
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'application/vnd.ms-excel'
-        ]:
-            file_content = extract_text_from_excel(file_path)
+    # Insert the record (committed together with its extracted text, if that's new)
+    try:
+        uploaded_file = UploadedFile(
+            session_id=session_id,
+            filename=stored_name,
+            original_filename=filename,
+            file_url=file_url,
+            file_type=file.content_type,
+            conversation_id=conversation_id,
+            content_sha256=content_sha256,
+            extraction_status=extraction_status
+        )
+        print(f'Adding to db: {uploaded_file}', flush=True)
+        db.session.add(uploaded_file)
+        if commit:
+            db.session.commit()
         else:
-            # Attempt reading as text
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    file_content = f.read()
-            except Exception as e:
-                print("Error reading file:", e)
-                file_content = "Error processing file."
+            db.session.flush()
+    except Exception as e:
+        # Rollback the session to avoid leaving it in a broken state
+        db.session.rollback()
+        print(f"Error while saving uploaded file record to the database: {e}", flush=True)
+        traceback.print_exc()
+        # Optionally, re-raise the exception to propagate it
+        raise e
 
-        # Local URL for the stored file
-        file_url = f"/uploads/{unique_filename}"
-        file_type = file.content_type
+    print(f'Added to db: {uploaded_file}', flush=True)
 
     return file_content, file_url, file_type, uploaded_file
 
@@ -197,135 +159,7 @@ def process_uploaded_file(
 def read_file_content(path):
     """
     Reads an existing file from a local path, returning its text content.
-    If you want to read from Azure for an existing file, you'll need to
-    download to a temp file or memory first (not implemented here).
-    """
-    file_extension = os.path.splitext(path)[1].lower()
-    if file_extension == '.pdf':
-        return extract_text_from_pdf(path)
-    elif file_extension in ['.docx', '.doc']:
-        return extract_text_from_docx(path)
-    elif file_extension in ['.xlsx', '.xls']:
-        return extract_text_from_excel(path)
-    else:
-        try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        except Exception as e:
-            print("Error reading file:", e)
-            return "Error processing file."
-
-
-# -----------------------
-# In-memory extractions
-# -----------------------
-def extract_content_from_memory(file_bytes, content_type):
-    """
-    Reads the file content from an in-memory bytes object.
+    Documents are parsed in a child process (utils/extraction_pool.py).
     """
-    if not file_bytes:
-        return ""
+    return extract_text(path, content_type_for_path(path))
 
-    if content_type == 'application/pdf':
-        return extract_pdf_from_memory(file_bytes)
-    elif content_type in [
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'application/msword'
-    ]:
-        return extract_docx_from_memory(file_bytes)
-    elif content_type in [
-        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        'application/vnd.ms-excel'
-    ]:
-        return extract_excel_from_memory(file_bytes)
-    else:
-        # Assume it's plain text
-        try:
-            return file_bytes.decode('utf-8', errors='ignore')
-        except Exception as e:
-            print("Error decoding in-memory text file:", e)
-            return "Error processing file."
-
-
-def extract_pdf_from_memory(file_bytes):
-    try:
-        reader = PdfReader(io.BytesIO(file_bytes))
-        file_content = ""
-        for page in reader.pages:
-            file_content += page.extract_text() or ""
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading PDF from memory:", e)
-        return "Error processing PDF file."
-
-
-def extract_docx_from_memory(file_bytes):
-    try:
-        doc = Document(io.BytesIO(file_bytes))
-        file_content = "\n".join([p.text for p in doc.paragraphs])
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading DOCX from memory:", e)
-        return "Error processing Word file."
-
-
-def extract_excel_from_memory(file_bytes):
-    try:
-        wb = load_workbook(filename=io.BytesIO(file_bytes))
-        sheet = wb.active
-        file_content = ""
-        for row in sheet.iter_rows(values_only=True):
-            file_content += ' '.join(str(cell) for cell in row if cell is not None) + "\n"
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading Excel from memory:", e)
-        return "Error processing Excel file."
-
-
-# -----------------------
-# Local file extractions
-# -----------------------
-def extract_text_from_pdf(file_path):
-    try:
-        reader = PdfReader(file_path)
-        file_content = ""
-        for page in reader.pages:
-            file_content += page.extract_text() or ""
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading PDF:", e)
-        return "Error processing PDF file."
-
-
-def extract_text_from_docx(file_path):
-    try:
-        doc = Document(file_path)
-        file_content = "\n".join([p.text for p in doc.paragraphs])
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading DOCX:", e)
-        return "Error processing Word file."
-
-
-def extract_text_from_excel(file_path):
-    try:
-        wb = load_workbook(file_path)
-        sheet = wb.active
-        file_content = ""
-        for row in sheet.iter_rows(values_only=True):
-            # Convert each cell to string if not None, then join
-            file_content += ' '.join(str(cell) for cell in row if cell is not None) + "\n"
-        return truncate_content(file_content)
-    except Exception as e:
-        print("Error reading Excel file:", e)
-        return "Error processing Excel file."
-
-
-def truncate_content(content):
-    """
-    Utility to ensure we don't exceed the WORD_LIMIT.
-    """
-    words = content.split()
-    if len(words) > WORD_LIMIT:
-        return ' '.join(words[:WORD_LIMIT]) + "\n\n[Text truncated after 50,000 words.]"
-    return content
@@ -0,0 +1,113 @@
+# utils/history_cache.py
+import os
+import threading
+
+from cachetools import LRUCache
+
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Rough per-message overhead (dict, ints, role string) on top of the content itself
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def history_entry_size(entry):
+    return sum(len(msg["content"]) + MESSAGE_OVERHEAD_BYTES for msg in entry["messages"]) + MESSAGE_OVERHEAD_BYTES
+
+
+class HistoryCache:
+    """
+    Write-through LRU of each conversation's newest `window` messages, capped at
+    `max_bytes` of message content.
+
+    Entries are filled on the first read and extended by every saved turn, so a
+    conversation's history is only read from the database once per process while
+    it stays warm. Each entry also records whether older messages exist beyond the
+    window (`has_more`), so tail reads of any size up to `window` can be answered.
+
+    Fills are versioned: a read that raced with a write to the same conversation
+    doesn't install what it read, since that may already be missing the new messages.
+    """
+
+    def __init__(self, window, max_bytes=HISTORY_CACHE_MAX_BYTES):
+        self.window = window
+        self._cache = LRUCache(maxsize=max_bytes, getsizeof=history_entry_size)
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id, limit):
+        """
+        Return (messages, has_more) for the newest `limit` messages, or None on a miss.
+        Messages are fresh dicts with id, role, content and token_count, oldest first.
+        """
+        with self._lock:
+            entry = self._cache.get(conversation_id) if limit <= self.window else None
+            if entry is None or (len(entry["messages"]) < limit and entry["has_more"]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            messages = entry["messages"][-limit:] if limit else []
+            has_more = entry["has_more"] or len(entry["messages"]) > len(messages)
+            return [dict(msg) for msg in messages], has_more
+
+    def begin_fill(self, conversation_id):
+        """
+        Token to pass to `fill` for a read that is about to hit the database.
+        """
+        with self._lock:
+            return self._epoch, self._versions.get(conversation_id, 0)
+
+    def fill(self, conversation_id, messages, has_more, token):
+        """
+        Cache the newest `window` messages read from the database (oldest first),
+        unless the conversation was written to since `begin_fill`.
+        """
+        with self._lock:
+            if token != (self._epoch, self._versions.get(conversation_id, 0)):
+                return
+            self._store(conversation_id, messages, has_more)
+
+    def append(self, conversation_id, messages):
+        """
+        Write-through for newly committed messages (dicts with id, role, content, token_count).
+        """
+        with self._lock:
+            if len(self._versions) >= 100000:
+                # Keep the version map bounded; bumping the epoch voids every in-flight fill
+                self._versions.clear()
+                self._epoch += 1
+            self._versions[conversation_id] = self._versions.get(conversation_id, 0) + 1
+
+            entry = self._cache.get(conversation_id)
+            if entry is None:
+                return
+            # Stored as a new entry so the LRU re-measures it
+            self._store(conversation_id, entry["messages"] + list(messages), entry["has_more"])
+
+    def _store(self, conversation_id, messages, has_more):
+        kept = [dict(msg) for msg in messages[-self.window:]]
+        entry = {"messages": kept, "has_more": has_more or len(messages) > len(kept)}
+        try:
+            self._cache[conversation_id] = entry
+        except ValueError:
+            # A single conversation bigger than the whole cache just isn't cached
+            self._cache.pop(conversation_id, None)
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._versions[conversation_id] = self._versions.get(conversation_id, 0) + 1
+            self._cache.pop(conversation_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "conversations": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self._cache.maxsize,
+                "window": self.window,
+            }
@@ -0,0 +1,59 @@
+# utils/pipeline.py
+import traceback
+from eventlet.timeout import Timeout
+
+
+class StagedExecutor:
+    """
+    Runs independent stages of a request concurrently on a shared eventlet GreenPool.
+
+    Each stage gets its own Flask app context (and therefore its own db.session),
+    so stages should return plain data (dicts, tuples, rows) rather than ORM
+    objects bound to that session. A stage that raises or runs past its timeout
+    resolves to its `default` instead, keeping the caller's response shape intact.
+    """
+
+    def __init__(self, flask_app, pool):
+        self.flask_app = flask_app
+        self.pool = pool
+        self._stages = {}
+
+    def spawn(self, name, func, *args, timeout=None, default=None, **kwargs):
+        """
+        Start `func(*args, **kwargs)` as stage `name` and return immediately.
+        """
+        def run_stage():
+            with self.flask_app.app_context():
+                try:
+                    with Timeout(timeout):
+                        return func(*args, **kwargs)
+                except Timeout:
+                    print(f"[StagedExecutor] Stage '{name}' timed out after {timeout}s", flush=True)
+                    return default
+                except Exception as e:
+                    print(f"[StagedExecutor] Stage '{name}' failed: {e}", flush=True)
+                    traceback.print_exc()
+                    return default
+
+        self._stages[name] = self.pool.spawn(run_stage)
+        return self
+
+    def has(self, name):
+        return name in self._stages
+
+    def result(self, name, default=None):
+        """
+        Wait for stage `name` and return its result (or `default` if it was never spawned).
+        """
+        green_thread = self._stages.get(name)
+        if green_thread is None:
+            return default
+        return green_thread.wait()
+
+    def cancel(self, name):
+        """
+        Stop a speculative stage whose result is no longer needed.
+        """
+        green_thread = self._stages.pop(name, None)
+        if green_thread is not None:
+            green_thread.kill()
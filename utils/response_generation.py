@@ -3,6 +3,9 @@ import os
 import uuid
 import graphviz
 
+# Ends a streamed reply that broke off midway, so the user and later turns can tell it's incomplete
+STREAM_INTERRUPTED_MARKER = "\n\n[response interrupted]"
+
 def generate_image(prompt, openai_client):
     """Generate an image using OpenAI's DALL-E 3 and return the image URL."""
     try:
@@ -83,3 +86,42 @@ def generate_chat_response(openai_client, messages, model, temperature):
     except Exception as e:
         print(f'Error in chat response generation: {e}')
         return "Error generating response."
+
+
+def generate_chat_response_stream(openai_client, messages, model, temperature, on_delta=None):
+    """
+    Generate a chat response using OpenAI's streaming ChatCompletion.
+
+    `on_delta` is called with each text fragment as it arrives; the full reply
+    is returned once the stream is exhausted. If the stream fails after some text
+    was sent, STREAM_INTERRUPTED_MARKER is streamed and appended to what arrived.
+    """
+    parts = []
+    try:
+        stream = openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=2000,
+            temperature=temperature,
+            stream=True
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        return "".join(parts)
+    except Exception as e:
+        print(f'Error in streaming chat response generation: {e}')
+        if not parts:
+            return "Error generating response."
+        # Keep whatever already reached the client rather than replacing it, marked as cut off
+        if on_delta:
+            try:
+                on_delta(STREAM_INTERRUPTED_MARKER)
+            except Exception as emit_error:
+                print(f'Error sending interrupted marker: {emit_error}')
+        return "".join(parts) + STREAM_INTERRUPTED_MARKER
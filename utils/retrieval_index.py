@@ -0,0 +1,218 @@
+# utils/retrieval_index.py
+"""
+Chunked vector index over extracted file text, so a question about files sends the
+model the few passages that match it instead of every file in full.
+
+Text is split into overlapping windows of RETRIEVAL_CHUNK_WORDS words, each embedded
+into a row of a NumPy matrix (unit length, so a dot product is the cosine similarity).
+Matrices are keyed by the file's SHA-256 and embedding provider, kept for the
+RETRIEVAL_CACHE_DOCS most recently used files in memory and saved as `.npz` files under
+`index_dir`, so they're built once, at upload (see cogs/file_extraction.py).
+
+Embedding providers (EMBEDDING_PROVIDER):
+    openai   OpenAI embeddings (EMBEDDING_MODEL); the default when an OpenAI key is set
+    hashing  Deterministic hashed bag of words; needs no network and is the fallback
+             whenever the configured provider fails
+"""
+import math
+import os
+import re
+import threading
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+
+import eventlet
+import numpy as np
+
+EMBEDDING_PROVIDER = os.getenv(
+    "EMBEDDING_PROVIDER", "openai" if os.getenv("OPENAI_KEY") or os.getenv("OPENAI_API_KEY") else "hashing"
+)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = 96
+HASHING_DIM = 512
+RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "200"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "40"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_CACHE_DOCS = int(os.getenv("RETRIEVAL_CACHE_DOCS", "32"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+WORD_RE = re.compile(r"\S+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or our she that the "
+    "their them they this to was we were what when where which who will with you your".split()
+)
+
+
+def chunk_text(text, chunk_words=RETRIEVAL_CHUNK_WORDS, overlap=RETRIEVAL_CHUNK_OVERLAP):
+    """
+    Split text into windows of `chunk_words` words, each starting `chunk_words - overlap`
+    words after the last. Chunks keep the text's own spacing and line breaks.
+    """
+    spans = [match.span() for match in WORD_RE.finditer(text or "")]
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_words]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_words >= len(spans):
+            break
+    return chunks
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing of a text's words (log-scaled counts, common words skipped).
+    Same input, same vector, on any machine.
+    """
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            if row and row % 16 == 0:
+                eventlet.sleep(0)  # a whole file takes ~100 ms; let other green threads run
+            counts = Counter(token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS)
+            for token, count in counts.items():
+                h = zlib.crc32(token.encode())
+                vectors[row, h % self.dim] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """
+    OpenAI embeddings, requested EMBEDDING_BATCH_SIZE texts at a time.
+    """
+
+    def __init__(self, client, model=EMBEDDING_MODEL):
+        self.client = client
+        self.model = model
+        self.name = f"openai-{model}"
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = self.client.embeddings.create(model=self.model, input=texts[start:start + EMBEDDING_BATCH_SIZE])
+            rows.extend(item.embedding for item in response.data)
+        return _normalize(np.array(rows, dtype=np.float32))
+
+
+def get_embedder(client=None, provider=EMBEDDING_PROVIDER):
+    if provider == "openai" and client is not None:
+        return OpenAIEmbedder(client)
+    if provider not in ("openai", "hashing"):
+        print(f"[RetrievalIndex] Unknown EMBEDDING_PROVIDER {provider!r}; using hashing", flush=True)
+    return HashingEmbedder()
+
+
+class RetrievalIndex:
+    """
+    Per-file chunk matrices and top-k search across any number of files.
+    """
+
+    def __init__(self, embedder=None, index_dir=None, max_docs=RETRIEVAL_CACHE_DOCS, top_k=RETRIEVAL_TOP_K):
+        self.embedder = embedder or HashingEmbedder()
+        self.fallback = self.embedder if isinstance(self.embedder, HashingEmbedder) else HashingEmbedder()
+        self.index_dir = index_dir
+        self.max_docs = max_docs
+        self.top_k = top_k
+        self._docs = OrderedDict()  # (provider name, sha256) -> (chunks, vectors)
+        self._lock = threading.Lock()
+
+    def add(self, sha256, text):
+        """
+        Chunk and embed a file's text (if not already indexed) with the configured provider.
+        """
+        try:
+            self._doc(self.embedder, sha256, lambda: text)
+        except Exception as e:
+            # Built on first search instead, with whichever provider is working then
+            print(f"[RetrievalIndex] Indexing {sha256[:12]} with {self.embedder.name} failed: {e}", flush=True)
+
+    def search(self, query, files, top_k=None):
+        """
+        Top-k chunks for `query` across `files`, an iterable of (sha256, label, load_text) where
+        load_text() returns the file's text if it has to be indexed now.
+        Returns [(score, label, chunk_number, chunk)], best first.
+        """
+        files = list(files)
+        try:
+            return self._search(self.embedder, query, files, top_k or self.top_k)
+        except Exception as e:
+            if self.embedder is self.fallback:
+                raise
+            print(f"[RetrievalIndex] {self.embedder.name} unavailable ({e}); searching with {self.fallback.name}", flush=True)
+            return self._search(self.fallback, query, files, top_k or self.top_k)
+
+    def _search(self, embedder, query, files, top_k):
+        query_vector = embedder.embed([query])[0]
+        scores, refs = [], []
+        for sha256, label, load_text in files:
+            chunks, vectors = self._doc(embedder, sha256, load_text)
+            if not chunks:
+                continue
+            scores.append(vectors @ query_vector)
+            refs.extend((label, number, chunk) for number, chunk in enumerate(chunks, 1))
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), *refs[i]) for i in best]
+
+    def _doc(self, embedder, sha256, load_text):
+        key = (embedder.name, sha256)
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+                return doc
+        doc = self._load(key)
+        if doc is None:
+            chunks = chunk_text(load_text() or "")
+            vectors = embedder.embed(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+            doc = (chunks, vectors)
+            self._save(key, doc)
+        with self._lock:
+            self._docs[key] = doc
+            while len(self._docs) > self.max_docs:
+                self._docs.popitem(last=False)
+        return doc
+
+    def _path(self, key):
+        name, sha256 = key
+        return os.path.join(self.index_dir, name, f"{sha256}.npz") if self.index_dir else None
+
+    def _load(self, key):
+        path = self._path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return [str(chunk) for chunk in data["chunks"]], data["vectors"]
+        except Exception as e:
+            print(f"[RetrievalIndex] Ignoring unreadable {path}: {e}", flush=True)
+            return None
+
+    def _save(self, key, doc):
+        path = self._path(key)
+        if not path:
+            return
+        chunks, vectors = doc
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+            np.savez(tmp_path, chunks=np.array(chunks, dtype=str), vectors=vectors)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[RetrievalIndex] Could not save {path}: {e}", flush=True)
@@ -0,0 +1,136 @@
+# utils/session_store.py
+"""
+Server-side Flask session storage in a single SQLite file.
+
+Replaces Flask-Session's filesystem backend (one pickle file per session, which
+never gets cleaned up). Sessions live in one indexed table in WAL mode, so every
+worker on the host shares them and lookups are a primary-key read. Expired rows
+are ignored on read and deleted in small batches by a background green thread,
+never on the request path. Multi-host deployments should use SESSION_BACKEND=redis.
+"""
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Optional
+
+import eventlet
+from flask import Flask
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+SESSION_CLEANUP_INTERVAL = int(os.getenv("SESSION_CLEANUP_INTERVAL", "300"))  # seconds
+SESSION_CLEANUP_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expiry REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_expiry ON sessions (expiry);
+"""
+
+
+class SQLiteSessionInterface(ServerSideSessionInterface):
+    """
+    Flask-Session interface backed by SQLite, with batched background expiry.
+    """
+
+    session_class = ServerSideSession
+    # Expiry is handled by our own background sweep, not Flask-Session's per-request cleanup
+    ttl = True
+
+    def __init__(
+        self,
+        app: Flask,
+        path: str,
+        key_prefix: str = Defaults.SESSION_KEY_PREFIX,
+        use_signer: bool = Defaults.SESSION_USE_SIGNER,
+        permanent: bool = Defaults.SESSION_PERMANENT,
+        sid_length: int = Defaults.SESSION_ID_LENGTH,
+        serialization_format: str = Defaults.SESSION_SERIALIZATION_FORMAT,
+        cleanup_interval: int = SESSION_CLEANUP_INTERVAL,
+    ):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._conn = None
+        self._conn_pid = None
+        self._cleanup_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            self._connection().executescript(SCHEMA)
+        super().__init__(app, key_prefix, use_signer, permanent, sid_length, serialization_format)
+
+    def _connection(self):
+        # One connection per process; a forked worker must not reuse its parent's
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def open_session(self, app, request):
+        self._ensure_cleanup()
+        return super().open_session(app, request)
+
+    def _retrieve_session_data(self, store_id: str) -> Optional[dict]:
+        rows = self._execute("SELECT data FROM sessions WHERE id = ? AND expiry > ?", (store_id, time.time()))
+        if rows:
+            return self.serializer.decode(rows[0][0])
+        return None
+
+    def _delete_session(self, store_id: str) -> None:
+        self._execute("DELETE FROM sessions WHERE id = ?", (store_id,))
+
+    def _upsert_session(self, session_lifetime, session: ServerSideSession, store_id: str) -> None:
+        expiry = time.time() + session_lifetime.total_seconds()
+        self._execute(
+            "INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry",
+            (store_id, self.serializer.encode(session), expiry)
+        )
+
+    def _delete_expired_sessions(self) -> int:
+        """
+        Delete expired sessions in batches, yielding between them. Returns the number removed.
+        """
+        removed = 0
+        while True:
+            with self._lock:
+                cursor = self._connection().execute(
+                    "DELETE FROM sessions WHERE id IN "
+                    "(SELECT id FROM sessions WHERE expiry <= ? LIMIT ?)",
+                    (time.time(), SESSION_CLEANUP_BATCH)
+                )
+                batch = cursor.rowcount
+            removed += batch
+            if batch < SESSION_CLEANUP_BATCH:
+                return removed
+            eventlet.sleep(0)
+
+    def _ensure_cleanup(self):
+        # Started lazily so the sweep runs in the serving worker, not the --preload parent
+        if self._cleanup_pid == os.getpid() or not self.cleanup_interval:
+            return
+        self._cleanup_pid = os.getpid()
+        eventlet.spawn_n(self._cleanup_loop)
+
+    def _cleanup_loop(self):
+        while True:
+            eventlet.sleep(self.cleanup_interval)
+            try:
+                removed = self._delete_expired_sessions()
+                if removed:
+                    print(f"[SQLiteSessionInterface] Removed {removed} expired session(s)", flush=True)
+            except Exception as e:
+                print(f"[SQLiteSessionInterface] Expired-session cleanup failed: {e}", flush=True)
+                traceback.print_exc()
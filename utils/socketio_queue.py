@@ -0,0 +1,54 @@
+# utils/socketio_queue.py
+"""
+Message queue for Socket.IO emits, so every worker and container can reach every room.
+
+Without a queue, `socketio.emit(..., room=session_id)` only reaches clients connected
+to the emitting process. With `SOCKETIO_MESSAGE_QUEUE` set, each emit is published
+on a Redis channel and every server delivers it to its own connected clients.
+
+    (unset)                   no queue; only safe with a single worker
+    redis://host:6379/1       Redis (shared by every worker and container)
+    fakeredis://              in-process Redis emulation (offline tests of the queue path)
+
+The React client connects with `transports: ["websocket"]`, so a session stays on
+one worker for its whole life and no sticky load balancing is needed. HTTP
+long-polling clients would need it (see nginx.conf).
+"""
+import os
+
+import socketio
+
+from utils.cache_backend import redis_client_from_url
+
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "mcchat-socketio")
+
+
+class FakeRedisManager(socketio.RedisManager):
+    """
+    RedisManager on the process-wide fakeredis server, so several Socket.IO servers
+    in one process fan out to each other exactly as separate workers would.
+    """
+
+    name = "fakeredis"
+
+    def _redis_connect(self):
+        self.redis = redis_client_from_url(self.redis_url)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.connected = True
+
+
+def create_client_manager(url=SOCKETIO_MESSAGE_QUEUE, channel=SOCKETIO_CHANNEL, write_only=False):
+    """
+    Client manager for `url` (see the module docstring), or None to keep the default in-process one.
+    """
+    if not url:
+        return None
+    if url.startswith("fakeredis://"):
+        return FakeRedisManager(url, channel=channel, write_only=write_only)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # No socket_timeout: the listener blocks on the pub/sub connection between messages
+        return socketio.RedisManager(
+            url, channel=channel, write_only=write_only, redis_options={"health_check_interval": 30}
+        )
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE URL: {url}")
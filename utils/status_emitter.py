@@ -0,0 +1,185 @@
+# utils/status_emitter.py
+"""
+Per-room coalescing for progress-style Socket.IO events.
+
+Status updates, job progress and streamed tokens can arrive far faster than a
+client needs them. StatusEmitter sends at most one batch per room every
+`min_interval` seconds:
+
+    update()  latest-wins events (status_update, job_update per job); a newer value
+              replaces one that hasn't been sent yet
+    delta()   token_delta text; pending deltas are concatenated, never dropped
+    emit()    final events (task_complete, job_complete, ...); sent at once, after
+              anything still pending for the room so ordering holds
+
+Backpressure: if a client in the room (on this worker) already has more than
+`max_client_queue` packets waiting to be written, the batch is held back and keeps
+coalescing, for up to `max_defer` seconds.
+"""
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+import eventlet
+
+STATUS_MIN_INTERVAL = float(os.getenv("STATUS_MIN_INTERVAL", "0.1"))  # seconds between batches per room
+STATUS_MAX_CLIENT_QUEUE = int(os.getenv("STATUS_MAX_CLIENT_QUEUE", "64"))  # queued packets before holding back
+STATUS_MAX_DEFER = float(os.getenv("STATUS_MAX_DEFER", "5"))  # longest a batch waits on a slow client
+IDLE_ROOM_SECONDS = 60
+NAMESPACE = "/"
+
+
+class StatusEmitter:
+    """
+    Rate-limited, coalescing emitter in front of `socketio.emit` for one process.
+    """
+
+    def __init__(self, socketio, min_interval=STATUS_MIN_INTERVAL,
+                 max_client_queue=STATUS_MAX_CLIENT_QUEUE, max_defer=STATUS_MAX_DEFER):
+        self.socketio = socketio
+        self.min_interval = min_interval
+        self.max_client_queue = max_client_queue
+        self.max_defer = max_defer
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self.emitted = 0
+        self.coalesced = 0
+        self.deferred = 0
+
+    # --- public API --------------------------------------------------------
+    def status(self, room, message):
+        self.update(room, "status_update", {"message": message})
+
+    def update(self, room, event, data, key=None):
+        """
+        Queue a latest-wins event; `key` separates independent streams of the same event (e.g. job IDs).
+        """
+        with self._lock:
+            state = self._state(room)
+            if state["pending"].pop((event, key), None) is not None:
+                self.coalesced += 1
+            state["pending"][(event, key)] = data
+        self._schedule(room)
+
+    def delta(self, room, text, event="token_delta"):
+        with self._lock:
+            state = self._state(room)
+            pending = state["pending"].get((event, None))
+            if pending is None:
+                state["pending"][(event, None)] = {"delta": text}
+            else:
+                pending["delta"] += text
+                self.coalesced += 1
+        self._schedule(room)
+
+    def emit(self, room, event, data):
+        """
+        Send `event` now, after flushing whatever is pending for the room.
+        """
+        self.flush(room)
+        self._send(room, event, data)
+
+    def flush(self, room):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None or not state["pending"]:
+                return
+            batch = list(state["pending"].items())
+            state["pending"].clear()
+            state["last"] = time.monotonic()
+            state["deferred_since"] = None
+        for (event, _key), data in batch:
+            self._send(room, event, data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "emitted": self.emitted,
+                "coalesced": self.coalesced,
+                "deferred": self.deferred,
+                "min_interval": self.min_interval,
+                "max_client_queue": self.max_client_queue,
+            }
+
+    # --- internals ---------------------------------------------------------
+    def _state(self, room):
+        state = self._rooms.get(room)
+        if state is None:
+            if len(self._rooms) >= 1000:
+                self._prune()
+            state = self._rooms[room] = {
+                "pending": OrderedDict(), "last": 0.0, "timer": False, "deferred_since": None,
+            }
+        return state
+
+    def _prune(self):
+        # Rooms keep their last-send time between bursts; drop the ones gone quiet
+        cutoff = time.monotonic() - IDLE_ROOM_SECONDS
+        for room, state in list(self._rooms.items()):
+            if state["last"] < cutoff and not state["pending"] and not state["timer"]:
+                del self._rooms[room]
+
+    def _schedule(self, room):
+        with self._lock:
+            state = self._rooms[room]
+            if state["timer"]:
+                return
+            wait = state["last"] + self.min_interval - time.monotonic()
+            if wait > 0:
+                state["timer"] = True
+        if wait > 0:
+            eventlet.spawn_after(wait, self._on_timer, room)
+        else:
+            self._flush_or_defer(room)
+
+    def _on_timer(self, room):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                return
+            state["timer"] = False
+        self._flush_or_defer(room)
+
+    def _flush_or_defer(self, room):
+        with self._lock:
+            state = self._rooms[room]
+            if not state["pending"]:
+                # Already flushed by an emit() in the meantime
+                state["deferred_since"] = None
+                return
+            now = time.monotonic()
+            hold = self._backlogged(room) and (
+                state["deferred_since"] is None or now - state["deferred_since"] < self.max_defer
+            )
+            if hold:
+                if state["deferred_since"] is None:
+                    state["deferred_since"] = now
+                self.deferred += 1
+                state["timer"] = True
+        if hold:
+            eventlet.spawn_after(self.min_interval, self._on_timer, room)
+        else:
+            self.flush(room)
+
+    def _backlogged(self, room):
+        # Only sees clients connected to this worker; others are drained by their own process
+        try:
+            server = self.socketio.server
+            for _sid, eio_sid in server.manager.get_participants(NAMESPACE, room):
+                sock = server.eio.sockets.get(eio_sid)
+                if sock is not None and sock.queue.qsize() > self.max_client_queue:
+                    return True
+        except Exception:
+            return False
+        return False
+
+    def _send(self, room, event, data):
+        try:
+            self.socketio.emit(event, data, room=room)
+            self.emitted += 1
+        except Exception as e:
+            print(f"[StatusEmitter] Failed to emit {event} to {room}: {e}", flush=True)
+            traceback.print_exc()
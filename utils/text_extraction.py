@@ -0,0 +1,177 @@
+# utils/text_extraction.py
+"""
+Text extraction from uploaded files on disk (PDF, Word, Excel, plain text).
+
+Kept free of Flask/DB imports so utils/extraction_pool.py can run it in a worker
+process:
+
+    python -m utils.text_extraction text <path> <content_type>
+    python -m utils.text_extraction pdf-pages <path> <start> <end>
+    python -m utils.text_extraction pdf-count <path>
+
+The worker writes one JSON object to stdout: {"text": ...}, {"count": ...} or {"error": ...}.
+Each parser is imported where it's used, so a worker only loads the one it needs.
+"""
+import json
+import os
+import sys
+
+WORD_LIMIT = 50000
+TEXT_READ_CHUNK = 256 * 1024  # characters per read of a plain-text upload
+
+PDF_TYPES = {'application/pdf'}
+WORD_TYPES = {
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/msword'
+}
+EXCEL_TYPES = {
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-excel'
+}
+EXTENSION_TYPES = {
+    '.pdf': 'application/pdf',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.doc': 'application/msword',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.xls': 'application/vnd.ms-excel',
+}
+
+
+def content_type_for_path(path):
+    return EXTENSION_TYPES.get(os.path.splitext(path)[1].lower(), 'text/plain')
+
+
+def error_text(content_type):
+    """
+    What extraction returns on failure for `content_type` (see EXTRACTION_ERRORS).
+    """
+    if content_type in PDF_TYPES:
+        return "Error processing PDF file."
+    if content_type in WORD_TYPES:
+        return "Error processing Word file."
+    if content_type in EXCEL_TYPES:
+        return "Error processing Excel file."
+    return "Error processing file."
+
+
+def extract_text_from_path(path, content_type):
+    """
+    Extract text from a file on disk according to its uploaded content type.
+    """
+    if content_type in PDF_TYPES:
+        return extract_text_from_pdf(path)
+    elif content_type in WORD_TYPES:
+        return extract_text_from_docx(path)
+    elif content_type in EXCEL_TYPES:
+        return extract_text_from_excel(path)
+    else:
+        # Attempt reading as text
+        try:
+            return read_text_file(path)
+        except Exception as e:
+            print("Error reading file:", e)
+            return "Error processing file."
+
+
+def extract_text_from_pdf(file_path):
+    try:
+        return truncate_content(extract_pdf_pages(file_path, word_limit=WORD_LIMIT))
+    except Exception as e:
+        print("Error reading PDF:", e)
+        return "Error processing PDF file."
+
+
+def extract_pdf_pages(file_path, start=0, end=None, word_limit=None):
+    """
+    Untruncated text of pages [start, end) of a PDF, stopping at the first page that takes it
+    past `word_limit` words (truncating gives the same result); raises on a broken file.
+    """
+    from PyPDF2 import PdfReader
+    reader = PdfReader(file_path)
+    file_content = ""
+    words = 0
+    for read, page in enumerate(reader.pages[start:end], 1):
+        text = page.extract_text() or ""
+        file_content += text
+        words += len(text.split())
+        # Pages are joined without a separator, which can merge a word across each boundary
+        if word_limit is not None and words - read > word_limit:
+            break
+    return file_content
+
+
+def pdf_page_count(file_path):
+    from PyPDF2 import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def extract_text_from_docx(file_path):
+    try:
+        from docx import Document
+        doc = Document(file_path)
+        file_content = "\n".join([p.text for p in doc.paragraphs])
+        return truncate_content(file_content)
+    except Exception as e:
+        print("Error reading DOCX:", e)
+        return "Error processing Word file."
+
+
+def extract_text_from_excel(file_path):
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path)
+        sheet = wb.active
+        file_content = ""
+        for row in sheet.iter_rows(values_only=True):
+            # Convert each cell to string if not None, then join
+            file_content += ' '.join(str(cell) for cell in row if cell is not None) + "\n"
+        return truncate_content(file_content)
+    except Exception as e:
+        print("Error reading Excel file:", e)
+        return "Error processing Excel file."
+
+
+def read_text_file(path):
+    """
+    Read a text file up to WORD_LIMIT words, without loading the rest of it.
+    """
+    parts, words = [], 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for chunk in iter(lambda: f.read(TEXT_READ_CHUNK), ''):
+            parts.append(chunk)
+            words += len(chunk.split())
+            if words > WORD_LIMIT:
+                break
+    return truncate_content(''.join(parts))
+
+
+def truncate_content(content):
+    """
+    Utility to ensure we don't exceed the WORD_LIMIT.
+    """
+    words = content.split()
+    if len(words) > WORD_LIMIT:
+        return ' '.join(words[:WORD_LIMIT]) + "\n\n[Text truncated after 50,000 words.]"
+    return content
+
+
+def _worker_main(argv):
+    op, path = argv[0], argv[1]
+    if op == "text":
+        return {"text": extract_text_from_path(path, argv[2])}
+    if op == "pdf-pages":
+        return {"text": extract_pdf_pages(path, int(argv[2]), int(argv[3]), word_limit=WORD_LIMIT)}
+    if op == "pdf-count":
+        return {"count": pdf_page_count(path)}
+    raise ValueError(f"Unknown operation {op}")
+
+
+if __name__ == "__main__":
+    # The parsers print their errors; keep stdout for the result
+    out, sys.stdout = sys.stdout, sys.stderr
+    try:
+        result = _worker_main(sys.argv[1:])
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    out.write(json.dumps(result))
+    out.flush()
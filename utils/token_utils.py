@@ -0,0 +1,23 @@
+# utils/token_utils.py
+import json
+from functools import lru_cache
+
+import tiktoken
+
+TOKEN_MODEL = "gpt-4o-mini"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=TOKEN_MODEL):
+    """
+    Load the tiktoken encoding for `model` once per process.
+    """
+    return tiktoken.encoding_for_model(model)
+
+
+def count_message_tokens(message, model=TOKEN_MODEL):
+    """
+    Number of tokens in a {role, content} message, counted the way trimming measures it
+    (the JSON-serialized message).
+    """
+    return len(get_encoding(model).encode(json.dumps(message)))